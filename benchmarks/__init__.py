@@ -0,0 +1,14 @@
+""" Offline benchmarks of the hot paths of the command line tools on synthetic data.
+
+Run from the root of the repository, e.g.
+
+    python -m benchmarks -o results.json
+    python -m benchmarks -o results.json --baseline baseline.json
+    python -m benchmarks --compare baseline.json results.json
+
+Every stage runs in a fresh process and reports its throughput, latency percentiles and peak RSS. Stages that need
+packages that are not installed (e.g. TensorFlow) are skipped. The benchmarks are not part of the installed package.
+
+`python -m benchmarks.startup` checks that the command line tools start without importing heavy dependencies, see
+`benchmarks.startup`.
+"""
@@ -0,0 +1,110 @@
+import sys
+
+
+def missing_requirements(requires):
+    """ Returns the modules of `requires` that cannot be imported.
+    """
+    from importlib.util import find_spec
+
+    return [module for module in requires if find_spec(module) is None]
+
+
+def run_benchmarks(stage_names, workdir, scale=1.0, repeat=3, progress=sys.stderr):
+    """ Prepares the inputs of and runs the given stages.
+    :return: results as written to the result file
+    """
+    import pathlib
+    from .harness import metadata, run_stage
+    from .stages import STAGES
+
+    pathlib.Path(workdir).mkdir(parents=True, exist_ok=True)
+    results = {'meta': metadata(scale, repeat), 'stages': {}}
+    for name in stage_names:
+        stage = STAGES[name]
+        missing = missing_requirements(stage.requires)
+        if missing:
+            results['stages'][name] = {'skipped': f"missing {', '.join(missing)}"}
+            print(f"{name}: skipped, missing {', '.join(missing)}", file=progress)
+            continue
+
+        print(f"{name}: preparing inputs", file=progress)
+        stage.prepare(workdir, scale)
+        print(f"{name}: running", file=progress)
+        results['stages'][name] = {'description': stage.description, **run_stage(stage.run, workdir, scale, repeat)}
+    return results
+
+
+def main():
+    import argparse
+    import json
+    import tempfile
+    from contextlib import nullcontext
+    from .harness import compare, print_comparison, print_results
+    from .stages import STAGES
+
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Benchmarks the hot paths of the command line tools on synthetic data. Every stage runs in a fresh '
+                    'process and reports its throughput, latency percentiles and peak RSS.')
+    parser.add_argument('-o', '--output', type=str, default=None,
+                        help='Write the results to the given .json file.')
+    parser.add_argument('-b', '--baseline', type=str, default=None,
+                        help='Compare the results with the results in the given .json file. Exits with status 2 if '
+                             'a metric is worse than the baseline by more than --tolerance.')
+    parser.add_argument('--compare', type=str, nargs=2, metavar=('BASELINE', 'RESULTS'), default=None,
+                        help='Only compare two result files without running any benchmark.')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.1,
+                        help='Relative change of a metric that counts as a regression, default is 0.1.')
+    parser.add_argument('-s', '--stages', type=str, default=None,
+                        help=f"Comma separated list of stages to run, default is all stages: {', '.join(STAGES)}")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Size factor of the synthetic inputs, default is 1.')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Number of measured passes over the inputs per stage after one warm-up pass, default is '
+                             '3.')
+    parser.add_argument('-w', '--workdir', type=str, default=None,
+                        help='Directory for the synthetic inputs. Inputs that already exist are reused. Defaults to '
+                             'a temporary directory.')
+    parser.add_argument('-l', '--list', action='store_true', help='List the stages and exit.')
+
+    args = parser.parse_args()
+
+    if args.list:
+        for name, stage in STAGES.items():
+            print(f"{name:<24} {stage.description}")
+        exit(0)
+
+    if args.compare:
+        with open(args.compare[0]) as fh:
+            baseline = json.load(fh)
+        with open(args.compare[1]) as fh:
+            results = json.load(fh)
+    else:
+        stage_names = [name for name in args.stages.split(',') if name] if args.stages else list(STAGES)
+        unknown = [name for name in stage_names if name not in STAGES]
+        if unknown:
+            print(f"Error: unknown stage(s): {', '.join(unknown)}", file=sys.stderr)
+            exit(1)
+
+        with (nullcontext(args.workdir) if args.workdir else tempfile.TemporaryDirectory()) as workdir:
+            results = run_benchmarks(stage_names, workdir, args.scale, args.repeat)
+
+        print_results(results)
+        if args.output:
+            with open(args.output, 'w') as fh:
+                json.dump(results, fh, indent=2)
+
+        if not args.baseline:
+            exit(0)
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+
+    rows = compare(baseline, results, args.tolerance)
+    print()
+    print_comparison(rows)
+    if any(regression for *_, regression in rows):
+        exit(2)
+
+
+if __name__ == '__main__':
+    main()
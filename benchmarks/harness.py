@@ -0,0 +1,206 @@
+""" Measurement, result files and baseline comparison of the benchmarks.
+"""
+
+import sys
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Latency percentiles reported per stage
+PERCENTILES = (50, 90, 95, 99)
+
+# (metric, higher is better) pairs compared against a baseline
+_COMPARED_METRICS = (('throughput', True), ('latency_ms.p50', False), ('latency_ms.p95', False),
+                     ('peak_rss_mb', False))
+
+
+class Timer:
+    """ Collects the latencies of the measured calls of a stage.
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self.items = 0
+        self.recording = True
+
+    def _record(self, seconds: float, items: int):
+        if self.recording:
+            self.latencies.append(seconds)
+            self.items += items
+
+    def passes(self, repeat: int):
+        """ Yields `repeat + 1` times, the calls of the first pass warm up caches and lazy imports and are not
+        recorded.
+        """
+        self.recording = False
+        yield 0
+        self.recording = True
+        for index in range(1, repeat + 1):
+            yield index
+
+    @contextmanager
+    def measure(self, items: int = 1):
+        """ Measures the enclosed block as one call that processes the given number of items.
+        """
+        start = time.perf_counter()
+        yield
+        self._record(time.perf_counter() - start, items)
+
+    def iterate(self, iterable, count: Optional[Callable] = None):
+        """ Iterates over `iterable` and measures every step as one call.
+        :param iterable: iterable to measure
+        :param count: function returning the number of items of a step, defaults to one item per step
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                value = next(iterator)
+            except StopIteration:
+                return
+            self._record(time.perf_counter() - start, count(value) if count else 1)
+            yield value
+
+
+def peak_rss_mb() -> float:
+    """ Returns the peak resident set size of the current process in MiB.
+    """
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB elsewhere
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def summarize(timer: Timer) -> Dict:
+    """ Returns the throughput and the latency percentiles of the calls measured by the timer. The throughput only
+    accounts for the time spent in measured calls, i.e. without the setup of the stage.
+    """
+    seconds = float(sum(timer.latencies))
+    latencies = np.array(timer.latencies) * 1000.0
+    latency = {f"p{p}": float(np.percentile(latencies, p)) for p in PERCENTILES} if len(latencies) else {}
+    if len(latencies):
+        latency.update(mean=float(latencies.mean()), max=float(latencies.max()))
+    return {
+        'items': timer.items,
+        'calls': len(latencies),
+        'seconds': seconds,
+        'throughput': timer.items / seconds if seconds > 0 else 0.0,
+        'latency_ms': latency,
+    }
+
+
+def _run_stage(run: Callable, workdir: str, scale: float, repeat: int) -> Dict:
+    """ Runs a stage in the current process, see `run_stage()`.
+    """
+    timer = Timer()
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    unit = run(workdir, scale, repeat, timer)
+    wall_seconds = time.perf_counter() - start
+
+    result = summarize(timer)
+    result.update(unit=unit, wall_seconds=wall_seconds, startup_rss_mb=rss_before, peak_rss_mb=peak_rss_mb())
+    return result
+
+
+def run_stage(run: Callable, workdir: str, scale: float, repeat: int) -> Dict:
+    """ Runs a stage in a fresh process, so the peak RSS and the imported modules of one stage do not affect the
+    others.
+    :param run: function `run(workdir, scale, repeat, timer) -> unit` that processes the inputs prepared in `workdir`
+        in the passes of `timer.passes(repeat)` and measures its calls with `timer`. It returns the name of the
+        processed items, e.g. 'files'.
+    :param workdir: directory containing the prepared inputs
+    :param scale: size factor of the inputs
+    :param repeat: number of measured passes over the inputs
+    :return: result of the stage, see `summarize()`
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(_run_stage, run, workdir, scale, repeat).result()
+
+
+def metadata(scale: float, repeat: int) -> Dict:
+    """ Returns information about the environment of a benchmark run.
+    """
+    import datetime
+    import os
+    import platform
+    import subprocess
+    import sof_utils
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'version': sof_utils.__version__,
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'scale': scale,
+        'repeat': repeat,
+    }
+
+
+def _metric(result: Dict, name: str):
+    for key in name.split('.'):
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+
+def compare(baseline: Dict, current: Dict, tolerance: float = 0.1) -> List[Tuple[str, str, float, float, float, bool]]:
+    """ Compares the stages of two benchmark runs.
+    :param baseline: results of the baseline run
+    :param current: results of the current run
+    :param tolerance: relative change of a metric in the worse direction that counts as a regression
+    :return: list of (stage, metric, baseline, current, relative change, regression) tuples
+    """
+    rows = []
+    for stage, result in current['stages'].items():
+        base = baseline['stages'].get(stage)
+        if base is None or 'skipped' in base or 'skipped' in result:
+            continue
+        for metric, higher_is_better in _COMPARED_METRICS:
+            old, new = _metric(base, metric), _metric(result, metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            regression = -change > tolerance if higher_is_better else change > tolerance
+            rows.append((stage, metric, old, new, change, regression))
+    return rows
+
+
+def print_comparison(rows: List[Tuple[str, str, float, float, float, bool]], file=sys.stdout):
+    """ Prints the result of `compare()` as a table.
+    """
+    print(f"{'stage':<24} {'metric':<16} {'baseline':>12} {'current':>12} {'change':>8}", file=file)
+    for stage, metric, old, new, change, regression in rows:
+        print(f"{stage:<24} {metric:<16} {old:>12.3f} {new:>12.3f} {change:>+8.1%}"
+              f"{'  REGRESSION' if regression else ''}", file=file)
+
+
+def print_results(results: Dict, file=sys.stdout):
+    """ Prints the results of a benchmark run as a table.
+    """
+    print(f"{'stage':<24} {'throughput':>20} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'peak RSS MiB':>13}",
+          file=file)
+    for stage, result in results['stages'].items():
+        if 'skipped' in result:
+            print(f"{stage:<24} skipped: {result['skipped']}", file=file)
+            continue
+        latency = result['latency_ms']
+        throughput = f"{result['throughput']:.1f} {result['unit']}/s"
+        print(f"{stage:<24} {throughput:>20} {latency.get('p50', 0):>10.3f} {latency.get('p95', 0):>10.3f} "
+              f"{latency.get('p99', 0):>10.3f} {result['peak_rss_mb']:>13.1f}", file=file)
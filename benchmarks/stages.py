@@ -0,0 +1,282 @@
+""" Benchmark stages, one per hot path of the command line tools.
+
+Every stage consists of a `prepare(workdir, scale)` function that writes the synthetic inputs into `workdir` (in the
+benchmark process, outside of the measurement) and a `run(workdir, scale, repeat, timer)` function that processes them
+in a fresh process, once per pass of `timer.passes(repeat)`, and returns the name of the processed items. Inputs that
+already exist are reused.
+
+Stages fall back to the entry points of earlier releases (e.g. `find_outliers()` instead of
+`find_outliers_streaming()`) if the newer ones do not exist, so the same benchmarks can be run on an older checkout
+to get a baseline. Stages without such an entry point require the module they measure.
+"""
+
+import pathlib
+from typing import Callable, NamedTuple, Tuple
+
+from . import synthetic
+
+_REPO = pathlib.Path(__file__).resolve().parent.parent
+
+# Sizes of the inputs for scale 1
+_NUM_DICOM_FILES = 200
+_DICOM_SIZE = (256, 256)
+_NUM_LABEL_FILES = 4
+_NUM_LABEL_ITEMS = 5000
+_NUM_KEYPOINT_ROWS = 50000
+_DESCRIPTOR_CHUNK_SIZE = 4096
+_NUM_EXAMPLES = 128
+_IMAGE_SIZE = (256, 512)
+_DETECTION_BATCH_SIZE = 8
+
+
+class Stage(NamedTuple):
+    description: str
+    prepare: Callable
+    run: Callable
+    # Modules that must be importable to run the stage
+    requires: Tuple[str, ...] = ()
+
+
+def _scaled(size: int, scale: float) -> int:
+    return max(1, int(round(size * scale)))
+
+
+def load_script(name: str):
+    """ Loads a command line tool from the bin directory as a module without running its main function.
+    :param name: name of the script, e.g. 'sof-keypoint-outliers'
+    :return: module
+    """
+    from importlib.machinery import SourceFileLoader
+    from importlib.util import module_from_spec, spec_from_loader
+
+    loader = SourceFileLoader(name.replace('-', '_'), str(_REPO.joinpath('bin', name)))
+    module = module_from_spec(spec_from_loader(loader.name, loader))
+    loader.exec_module(module)
+    return module
+
+
+def _dicom_dir(workdir, scale) -> pathlib.Path:
+    return pathlib.Path(workdir).joinpath(f"dicom-{_scaled(_NUM_DICOM_FILES, scale)}")
+
+
+def _prepare_dicom(workdir, scale):
+    directory = _dicom_dir(workdir, scale)
+    if not directory.exists():
+        synthetic.write_dicom_files(directory, _scaled(_NUM_DICOM_FILES, scale), _DICOM_SIZE)
+
+
+def _run_dicom_meta(workdir, scale, repeat, timer):
+    from sof_utils import dicom
+
+    for _ in timer.passes(repeat):
+        for _ in timer.iterate(dicom.list_meta(str(_dicom_dir(workdir, scale)))):
+            pass
+    return 'files'
+
+
+def _run_dicom_read_image(workdir, scale, repeat, timer):
+    from sof_utils import dicom
+
+    files = sorted(dicom.list_files(str(_dicom_dir(workdir, scale))))
+    for _ in timer.passes(repeat):
+        for file in files:
+            with timer.measure():
+                dicom.read_image(str(file))
+    return 'images'
+
+
+def _run_dicom_read_image_cached(workdir, scale, repeat, timer):
+    import tempfile
+    from sof_utils import dicom
+    from sof_utils.pixel_cache import PixelCache
+
+    files = sorted(dicom.list_files(str(_dicom_dir(workdir, scale))))
+    with tempfile.TemporaryDirectory(dir=workdir) as cache_dir:
+        cache = PixelCache(cache_dir)
+        # The warm-up pass fills the cache, the measured passes only map the cached images
+        for _ in timer.passes(repeat):
+            for file in files:
+                with timer.measure():
+                    dicom.read_image(str(file), cache=cache)
+    return 'images'
+
+
+def _label_dir(workdir, scale) -> pathlib.Path:
+    return pathlib.Path(workdir).joinpath(f"labels-{_scaled(_NUM_LABEL_ITEMS, scale)}")
+
+
+def _prepare_labels(workdir, scale):
+    directory = _label_dir(workdir, scale)
+    if not directory.exists():
+        synthetic.write_label_studio_files(directory, _NUM_LABEL_FILES, _scaled(_NUM_LABEL_ITEMS, scale))
+
+
+def _run_labels(workdir, scale, repeat, timer):
+    import contextlib
+    import io
+    from sof_utils import misc
+
+    files = sorted(str(file) for file in _label_dir(workdir, scale).glob('*.json'))
+    if hasattr(misc, 'iter_labels'):
+        read_labels = misc.iter_labels
+    else:
+        def read_labels(label_files):
+            return (label for label_file in label_files for label in misc.read_label_file(label_file))
+
+    # Invalid annotations are reported on stderr
+    with contextlib.redirect_stderr(io.StringIO()):
+        for _ in timer.passes(repeat):
+            for _ in timer.iterate(read_labels(files)):
+                pass
+    return 'annotations'
+
+
+def _keypoint_csv(workdir, scale) -> pathlib.Path:
+    return pathlib.Path(workdir).joinpath(f"keypoints-{_scaled(_NUM_KEYPOINT_ROWS, scale)}.csv")
+
+
+def _prepare_keypoints(workdir, scale):
+    filename = _keypoint_csv(workdir, scale)
+    if not filename.exists():
+        synthetic.write_keypoint_csv(filename, _scaled(_NUM_KEYPOINT_ROWS, scale))
+
+
+def _run_keypoint_table(workdir, scale, repeat, timer):
+    outliers = load_script('sof-keypoint-outliers')
+
+    filename = str(_keypoint_csv(workdir, scale))
+    for _ in timer.passes(repeat):
+        if hasattr(outliers, 'iter_columns'):
+            for _ in timer.iterate(outliers.iter_columns(filename), count=lambda chunk: len(chunk['id'])):
+                pass
+        else:
+            with timer.measure(_scaled(_NUM_KEYPOINT_ROWS, scale)):
+                outliers.get_kp_vectors(outliers.load_table(filename))
+    return 'rows'
+
+
+def _run_keypoint_descriptors(workdir, scale, repeat, timer):
+    outliers = load_script('sof-keypoint-outliers')
+
+    if hasattr(outliers, 'compute_descriptors'):
+        keypoints = outliers.load_columns(str(_keypoint_csv(workdir, scale)))['keypoints'].reshape((-1, 12, 2))
+        compute = outliers.compute_descriptors
+    else:
+        # One descriptor per row dictionary of the complete hips
+        keypoints = outliers.get_kp_vectors(outliers.load_table(str(_keypoint_csv(workdir, scale))))
+
+        def compute(rows):
+            for row in rows:
+                outliers.compute_descriptor(row)
+
+    for _ in timer.passes(repeat):
+        for start in range(0, len(keypoints), _DESCRIPTOR_CHUNK_SIZE):
+            chunk = keypoints[start:start + _DESCRIPTOR_CHUNK_SIZE]
+            with timer.measure(len(chunk)):
+                compute(chunk)
+    return 'hips'
+
+
+def _run_keypoint_outliers(workdir, scale, repeat, timer):
+    outliers = load_script('sof-keypoint-outliers')
+
+    filename = str(_keypoint_csv(workdir, scale))
+    if hasattr(outliers, 'find_outliers_streaming'):
+        find_outliers = outliers.find_outliers_streaming
+    else:
+        def find_outliers(file_path):
+            return outliers.find_outliers(outliers.load_table(file_path))
+
+    for _ in timer.passes(repeat):
+        with timer.measure(_scaled(_NUM_KEYPOINT_ROWS, scale)):
+            find_outliers(filename)
+    return 'rows'
+
+
+def _prepare_nothing(workdir, scale):
+    pass
+
+
+def _run_convert_tfds(workdir, scale, repeat, timer):
+    convert = load_script('sof-convert-tfds')
+
+    examples = list(synthetic.sof_hip_dataset(_scaled(_NUM_EXAMPLES, scale), _IMAGE_SIZE))
+    for _ in timer.passes(repeat):
+        for example in examples:
+            with timer.measure():
+                convert.convert_example(example).SerializeToString()
+    return 'examples'
+
+
+def _run_export_images(workdir, scale, repeat, timer):
+    import contextlib
+    import inspect
+    import io
+    import tempfile
+    from sof_utils.export import export_images
+
+    num_examples = _scaled(_NUM_EXAMPLES, scale)
+    ds = synthetic.sof_hip_dataset(num_examples, _IMAGE_SIZE)
+    # Earlier releases always export serially
+    kwargs = dict(workers=0) if 'workers' in inspect.signature(export_images).parameters else {}
+    for _ in timer.passes(repeat):
+        with tempfile.TemporaryDirectory(dir=workdir) as target, contextlib.redirect_stderr(io.StringIO()), \
+                timer.measure(2 * num_examples):
+            export_images(ds, target, downsample_to=(None, _IMAGE_SIZE[1] // 2), split_lr=True, flip_lr=True,
+                          **kwargs)
+    return 'images'
+
+
+def _run_detect_keypoints(workdir, scale, repeat, timer):
+    import tensorflow as tf
+
+    detect = load_script('sof-detect-keypoints')
+
+    def decode_image(image):
+        return tf.io.decode_png(image, channels=1)
+
+    ds = synthetic.sof_hip_dataset(_scaled(_NUM_EXAMPLES, scale), _IMAGE_SIZE)
+    if not hasattr(detect, 'process_examples'):
+        # Earlier releases decode the images and call the model on both halves one example after another, and expect
+        # a single detection per call
+        model = synthetic.StubDetectionModel(num_detections=1)
+        for _ in timer.passes(repeat):
+            for example in ds:
+                with timer.measure():
+                    detect.process_example({**example, 'image': decode_image(example['image'])}, model)
+        return 'images'
+
+    ds = detect.input_pipeline(ds, decode_image=decode_image)
+    model = synthetic.StubDetectionModel()
+    for _ in timer.passes(repeat):
+        for _ in timer.iterate(detect.process_examples(ds, model, batch_size=_DETECTION_BATCH_SIZE),
+                               count=lambda columns: len(columns['id'])):
+            pass
+    return 'images'
+
+
+STAGES = {
+    'dicom_meta': Stage("dicom.list_meta() on uncompressed DICOM files (sof-dicom-meta)",
+                        _prepare_dicom, _run_dicom_meta),
+    'dicom_read_image': Stage("dicom.read_image() on uncompressed DICOM files",
+                              _prepare_dicom, _run_dicom_read_image),
+    'dicom_read_image_cached': Stage("dicom.read_image() with a warm pixel cache (sof-pixel-cache)",
+                                     _prepare_dicom, _run_dicom_read_image_cached, ('sof_utils.pixel_cache',)),
+    'label_studio': Stage("misc.iter_labels() (or read_label_file()) on Label Studio exports (sof-convert-labels)",
+                          _prepare_labels, _run_labels),
+    'keypoint_table': Stage("Parsing a key-point table into key-point arrays (sof-keypoint-outliers)",
+                            _prepare_keypoints, _run_keypoint_table),
+    'keypoint_descriptors': Stage("compute_descriptors() (or compute_descriptor()) on the hips of a key-point table "
+                                  "(sof-keypoint-outliers)",
+                                  _prepare_keypoints, _run_keypoint_descriptors),
+    'keypoint_outliers': Stage("find_outliers_streaming() (or find_outliers()) on a key-point table "
+                               "(sof-keypoint-outliers)",
+                               _prepare_keypoints, _run_keypoint_outliers),
+    'convert_tfds': Stage("convert_example() on a synthetic SOF_hip dataset (sof-convert-tfds)",
+                          _prepare_nothing, _run_convert_tfds, ('tensorflow',)),
+    'export_images': Stage("export.export_images() of a synthetic SOF_hip dataset (sof-export-images)",
+                           _prepare_nothing, _run_export_images, ('tensorflow', 'tqdm')),
+    'detect_keypoints': Stage("process_examples() (or process_example()) with a stub model on a synthetic SOF_hip "
+                              "dataset (sof-detect-keypoints)",
+                              _prepare_nothing, _run_detect_keypoints, ('tensorflow',)),
+}
@@ -0,0 +1,148 @@
+""" Startup-time regression check of the command line tools.
+
+Runs every command line tool with `--help` and imports every module of the package in a fresh interpreter, and fails
+if one of them imports a heavy dependency (e.g. TensorFlow) or, with `--max-seconds`, takes too long. Imports are
+detected when they are attempted, so the check also works if the dependencies are not installed.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --max-seconds 0.5 -o startup.json
+"""
+
+import pathlib
+import sys
+from typing import Dict, List, Tuple
+
+_REPO = pathlib.Path(__file__).resolve().parent.parent
+
+# Top level modules that must not be imported by `--help` or by importing a module of the package
+HEAVY_MODULES = ('tensorflow', 'tensorflow_datasets', 'SOF_hip', 'cv2', 'scipy', 'matplotlib')
+
+# Runs a target in the child process and prints the attempted heavy imports and the time as JSON
+_PROBE = '''
+import contextlib, io, json, runpy, sys, time
+
+heavy = set(sys.argv[3].split(','))
+attempted = []
+
+class Recorder:
+    @staticmethod
+    def find_spec(name, path=None, target=None):
+        top = name.partition('.')[0]
+        if top in heavy and top not in attempted:
+            attempted.append(top)
+        return None
+
+sys.meta_path.insert(0, Recorder)
+kind, target = sys.argv[1:3]
+error = None
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+    try:
+        if kind == 'script':
+            sys.argv = [target, '--help']
+            runpy.run_path(target, run_name='__main__')
+        else:
+            __import__(target)
+    except SystemExit:
+        pass
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+print(json.dumps({'seconds': time.perf_counter() - start, 'heavy_imports': attempted, 'error': error}))
+'''
+
+
+def targets() -> List[Tuple[str, str, str]]:
+    """ Returns the checked targets: the command line tools and the modules of the package.
+    :return: list of (name, kind, target) tuples, kind is 'script' or 'module'
+    """
+    scripts = [(path.name, 'script', str(path)) for path in sorted(_REPO.joinpath('bin').iterdir()) if path.is_file()]
+    modules = [(f"sof_utils.{path.stem}", 'module', f"sof_utils.{path.stem}")
+               for path in sorted(_REPO.joinpath('sof_utils').glob('*.py')) if path.stem != '__init__']
+    return scripts + modules
+
+
+def probe(kind: str, target: str, heavy_modules=HEAVY_MODULES) -> Dict:
+    """ Runs a target in a fresh interpreter.
+    :return: dictionary with the wall time of the interpreter including its startup ('wall_seconds'), the time of
+        the target itself ('seconds'), the attempted imports of heavy modules ('heavy_imports') and the error raised
+        by the target ('error')
+    """
+    import json
+    import os
+    import subprocess
+    import time
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(_REPO), env.get('PYTHONPATH')]))
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', _PROBE, kind, target, ','.join(heavy_modules)], env=env,
+                            capture_output=True, text=True, check=True).stdout
+    wall_seconds = time.perf_counter() - start
+    return {'wall_seconds': wall_seconds, **json.loads(output.strip().splitlines()[-1])}
+
+
+def check(repeat: int = 3, max_seconds=None, heavy_modules=HEAVY_MODULES) -> Dict[str, Dict]:
+    """ Probes all targets `repeat` times and reports the median times.
+    :param repeat: number of runs per target
+    :param max_seconds: if given, maximum median wall time per target
+    :param heavy_modules: top level modules that must not be imported
+    :return: dictionary mapping target names to results, results contain a list of 'failures'
+    """
+    from statistics import median
+
+    results = {}
+    for name, kind, target in targets():
+        runs = [probe(kind, target, heavy_modules) for _ in range(repeat)]
+        result = {
+            'kind': kind,
+            'wall_seconds': median(run['wall_seconds'] for run in runs),
+            'seconds': median(run['seconds'] for run in runs),
+            'heavy_imports': sorted({module for run in runs for module in run['heavy_imports']}),
+            'error': runs[0]['error'],
+        }
+        failures = [f"imports {module}" for module in result['heavy_imports']]
+        if result['error']:
+            failures.append(f"fails with {result['error']}")
+        if max_seconds is not None and result['wall_seconds'] > max_seconds:
+            failures.append(f"takes {result['wall_seconds']:.3f}s > {max_seconds}s")
+        results[name] = {**result, 'failures': failures}
+    return results
+
+
+def main():
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.startup',
+        description='Checks that the command line tools (with --help) and the modules of the package start fast and '
+                    'do not import heavy dependencies. Exits with status 1 if a check fails.')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Number of runs per target, the median time is reported. Default is 3.')
+    parser.add_argument('--max-seconds', type=float, default=None,
+                        help='Maximum wall time per target including the interpreter startup.')
+    parser.add_argument('--heavy-modules', type=str, default=','.join(HEAVY_MODULES),
+                        help=f"Comma separated list of modules that must not be imported, default is "
+                             f"{','.join(HEAVY_MODULES)}.")
+    parser.add_argument('-o', '--output', type=str, default=None,
+                        help='Write the results to the given .json file.')
+
+    args = parser.parse_args()
+
+    results = check(args.repeat, args.max_seconds, [module for module in args.heavy_modules.split(',') if module])
+
+    print(f"{'target':<34} {'wall ms':>9} {'target ms':>10}  result")
+    for name, result in results.items():
+        print(f"{name:<34} {1000 * result['wall_seconds']:>9.1f} {1000 * result['seconds']:>10.1f}  "
+              f"{'; '.join(result['failures']) or 'ok'}")
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+
+    if any(result['failures'] for result in results.values()):
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+""" Generators of synthetic inputs for the benchmarks.
+All generators are deterministic for a given seed.
+"""
+
+import pathlib
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+# Number of key points of the proximal femur annotations
+NUM_KEYPOINTS = 12
+
+_CLASSES = ("Complete", "Incomplete", "Implant")
+
+
+def write_dicom_files(directory: Union[str, pathlib.Path], num_files: int, size: Tuple[int, int] = (512, 512),
+                      seed: int = 0) -> List[pathlib.Path]:
+    """ Writes uncompressed 16 bit monochrome DICOM files named like the SOF radiographs (SF<ID>V<Visit>H.dcm).
+    :param directory: directory the files are written to
+    :param num_files: number of files
+    :param size: (width, height) of the images
+    :param seed: random seed of the pixel data
+    :return: paths of the written files
+    """
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian, SecondaryCaptureImageStorage, generate_uid
+
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    files = []
+    for index in range(num_files):
+        pixels = rng.integers(0, 4096, size=(size[1], size[0]), dtype=np.uint16)
+
+        file_meta = FileMetaDataset()
+        file_meta.MediaStorageSOPClassUID = SecondaryCaptureImageStorage
+        file_meta.MediaStorageSOPInstanceUID = generate_uid()
+        file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+        dcm = Dataset()
+        dcm.file_meta = file_meta
+        dcm.SOPClassUID = file_meta.MediaStorageSOPClassUID
+        dcm.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+        dcm.Modality = 'CR'
+        dcm.PatientID = str(10000 + index // 2)
+        dcm.SamplesPerPixel = 1
+        dcm.PhotometricInterpretation = 'MONOCHROME2'
+        dcm.Rows, dcm.Columns = pixels.shape
+        dcm.BitsAllocated = 16
+        dcm.BitsStored = 12
+        dcm.HighBit = 11
+        dcm.PixelRepresentation = 0
+        dcm.SmallestImagePixelValue = int(pixels.min())
+        dcm.LargestImagePixelValue = int(pixels.max())
+        dcm.PixelData = pixels.tobytes()
+
+        file = directory.joinpath(f"SF{10000 + index // 2}V{index % 2 + 1}H.dcm")
+        dcm.save_as(str(file), enforce_file_format=True)
+        files.append(file)
+    return files
+
+
+def label_studio_items(num_items: int, seed: int = 0, invalid_fraction: float = 0.05,
+                       duplicate_fraction: float = 0.05) -> List[Dict]:
+    """ Returns annotations in the Label Studio JSON_MIN format as exported for the proximal femur labels.
+    :param num_items: number of annotations
+    :param seed: random seed
+    :param invalid_fraction: fraction of annotations with a wrong number of key points
+    :param duplicate_fraction: fraction of annotations of images that were annotated before
+    :return: list of annotations
+    """
+    from random import Random
+
+    rng = Random(seed)
+    items = []
+    for index in range(num_items):
+        if items and rng.random() < duplicate_fraction:
+            image = rng.choice(items)['image']
+        else:
+            image = f"/data/upload/{index}-{10000 + index // 4}V{index // 2 % 2 + 1}{'LR'[index % 2]}-" \
+                    f"{rng.randint(800, 1200)}x{rng.randint(1600, 2400)}.png"
+        item = {'image': image, 'id': index}
+
+        kind = rng.random()
+        if kind < 0.1:
+            item['labels'] = rng.choice(["Incomplete", ["Implant", "UpsideDown"]])
+        else:
+            num_keypoints = 1 if kind < 0.1 + invalid_fraction else NUM_KEYPOINTS
+            if kind > 0.9:
+                item['labels'] = ["UpsideDown"]
+            item['keypoints'] = [{'x': rng.uniform(0, 100), 'y': rng.uniform(0, 100), 'width': 0.5,
+                                  'keypointlabels': [f"kp{kp}"]} for kp in range(num_keypoints)]
+        items.append(item)
+    return items
+
+
+def write_label_studio_files(directory: Union[str, pathlib.Path], num_files: int, items_per_file: int,
+                             seed: int = 0) -> List[pathlib.Path]:
+    """ Writes Label Studio exports, see `label_studio_items()`.
+    :return: paths of the written .json files
+    """
+    import json
+
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    files = []
+    for index in range(num_files):
+        file = directory.joinpath(f"export-{index}.json")
+        with open(file, 'w') as fh:
+            json.dump(label_studio_items(items_per_file, seed + index), fh, indent=1)
+        files.append(file)
+    return files
+
+
+def keypoints(num_rows: int, seed: int = 0) -> np.ndarray:
+    """ Returns plausible relative key points of proximal femurs: a common shape that is scaled, shifted and
+    distorted per row.
+    :return: (num_rows, NUM_KEYPOINTS, 2) array of (x, y) coordinates
+    """
+    rng = np.random.default_rng(seed)
+    shape = rng.uniform(0.2, 0.8, size=(NUM_KEYPOINTS, 2))
+    scale = rng.uniform(0.8, 1.2, size=(num_rows, 1, 1))
+    shift = rng.normal(0.0, 0.05, size=(num_rows, 1, 2))
+    noise = rng.normal(0.0, 0.01, size=(num_rows, NUM_KEYPOINTS, 2))
+    return shape * scale + shift + noise
+
+
+def write_keypoint_csv(filename: Union[str, pathlib.Path], num_rows: int, seed: int = 0,
+                       incomplete_fraction: float = 0.05) -> pathlib.Path:
+    """ Writes a key-point table with the columns written by `sof-detect-keypoints`.
+    :param filename: path of the .csv file
+    :param num_rows: number of rows, i.e. images
+    :param seed: random seed
+    :param incomplete_fraction: fraction of hips that are not classified as complete
+    :return: path of the written file
+    """
+    from csv import writer
+
+    rng = np.random.default_rng(seed)
+    sides = {side: keypoints(num_rows, seed + offset) for offset, side in enumerate(('left', 'right'))}
+    classes = {side: np.where(rng.random(num_rows) < incomplete_fraction, "Incomplete", "Complete")
+               for side in sides}
+
+    header = ['id', 'visit', 'width', 'height', 'upside_down', 'left_class', 'left_score', 'right_class',
+              'right_score']
+    for side in sides:
+        header += [f"{side}_kp{index}{axis}" for index in range(NUM_KEYPOINTS) for axis in 'xy']
+
+    filename = pathlib.Path(filename)
+    with open(filename, 'w', newline='') as fh:
+        csv_writer = writer(fh)
+        csv_writer.writerow(header)
+        for row in range(num_rows):
+            values = [10000 + row // 2, row % 2 + 1, 2000, 2000, 0]
+            for side in sides:
+                values += [classes[side][row], 0.9]
+            for kpts in sides.values():
+                values += kpts[row].reshape(-1).tolist()
+            csv_writer.writerow(values)
+    return filename
+
+
+def sof_hip_dataset(num_examples: int, size: Tuple[int, int] = (256, 512), encoded: bool = True, seed: int = 0):
+    """ Returns a `tf.data.Dataset` shaped like the 'keypoint_detection' configuration of the SOF_hip TFDS dataset.
+    The images are random noise.
+    :param num_examples: number of examples
+    :param size: (width, height) of the images
+    :param encoded: if true, the images are PNG encoded like the dataset loaded with `tfds.decode.SkipDecoding()`
+    :param seed: random seed
+    :return: dataset
+    """
+    import tensorflow as tf
+
+    rng = np.random.default_rng(seed)
+    images = rng.integers(0, 256, size=(num_examples, size[1], size[0], 1), dtype=np.uint8)
+    kpts = keypoints(num_examples, seed)[..., ::-1].astype(np.float32)
+
+    features = {
+        'image': [tf.io.encode_png(image).numpy() for image in images] if encoded else images,
+        'image/filename': [f"{10000 + index // 4}V{index // 2 % 2 + 1}.png".encode('utf8')
+                           for index in range(num_examples)],
+        'image/id': np.array([10000 + index // 4 for index in range(num_examples)], dtype=np.int64),
+        'image/visit': np.array([index // 2 % 2 + 1 for index in range(num_examples)], dtype=np.int64),
+        'image/left_right': [b'LR'[index % 2:index % 2 + 1] for index in range(num_examples)],
+        'image/upside_down': np.zeros(num_examples, dtype=np.int64),
+        'object/class': rng.integers(0, len(_CLASSES), size=num_examples, dtype=np.int64),
+        'object/bbox': np.concatenate([kpts.min(axis=1), kpts.max(axis=1)], axis=-1),
+        'object/keypoints': kpts,
+    }
+    return tf.data.Dataset.from_tensor_slices(features)
+
+
+class StubDetectionModel:
+    """ Replaces the saved key point detection model of `sof-detect-keypoints`. Returns the same fixed detections
+    for every image, the cost of the model itself is not part of the benchmarks.
+    """
+
+    def __init__(self, num_detections: int = 100, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.num_detections = num_detections
+        self.keypoints = keypoints(num_detections, seed)[..., ::-1].astype(np.float32)
+        self.scores = np.sort(rng.random(num_detections).astype(np.float32))[::-1]
+        self.classes = rng.integers(1, len(_CLASSES) + 1, size=num_detections).astype(np.float32)
+
+    def __call__(self, images) -> Dict[str, np.ndarray]:
+        batch_size = int(images.shape[0])
+
+        def batch(value):
+            return np.broadcast_to(value, (batch_size, *value.shape))
+
+        return {
+            'num_detections': np.full(batch_size, self.num_detections, dtype=np.float32),
+            'detection_classes': batch(self.classes),
+            'detection_keypoints': batch(self.keypoints),
+            'detection_scores': batch(self.scores),
+        }
@@ -17,7 +17,7 @@ setuptools.setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/ithron/SOF-Utils",
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=['benchmarks', 'benchmarks.*']),
     classifiers=[
         "Environment :: Console",
         "Intended Audience :: Science/Research",
@@ -33,7 +33,8 @@ setuptools.setup(
         'bin/sof-convert-labels',
         'bin/sof-convert-tfds',
         'bin/sof-detect-keypoints',
-        'bin/sof-keypoint-outliers'
+        'bin/sof-keypoint-outliers',
+        'bin/sof-pixel-cache'
     ],
     install_requires=requirements
 )
@@ -1,4 +1,7 @@
-import tensorflow as tf
+from .lazy_import import lazy_import
+
+tf = lazy_import('tensorflow')
+
 
 def int64_feature(value):
   return tf.train.Feature(int64_list=tf.train.Int64List(value=[value]))
@@ -2,20 +2,239 @@
 """
 
 import pathlib
-from typing import Tuple, Generator
+from typing import Tuple, Generator, Iterable, Callable, TypeVar, Dict, Any, Optional, List
 
 import numpy as np
 
+from .dicom_index import DicomIndex
+from .pixel_cache import PixelCache, downsample_image
 
-def read_meta(dcm_filename: str) -> Tuple[int, int, int, int]:
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+META_KEYWORDS = ('Columns', 'Rows', 'SmallestImagePixelValue', 'LargestImagePixelValue')
+
+# Number of bytes read from the beginning of a DICOM file by the fast header parser
+HEADER_PREFIX_SIZE = 64 * 1024
+
+_IMPLICIT_VR_LITTLE_ENDIAN = '1.2.840.10008.1.2'
+_EXPLICIT_VR_BIG_ENDIAN = '1.2.840.10008.1.2.2'
+_DEFLATED_EXPLICIT_VR_LITTLE_ENDIAN = '1.2.840.10008.1.2.1.99'
+
+_ITEM = 0xFFFEE000
+_ITEM_DELIMITATION = 0xFFFEE00D
+_SEQUENCE_DELIMITATION = 0xFFFEE0DD
+_PIXEL_REPRESENTATION = 0x00280103
+_UNDEFINED_LENGTH = 0xFFFFFFFF
+
+# Explicit VRs using a 2 byte reserved field followed by a 4 byte length
+_LONG_VRS = {'OB', 'OD', 'OF', 'OL', 'OV', 'OW', 'SQ', 'SV', 'UC', 'UN', 'UR', 'UT', 'UV'}
+_BINARY_VRS = {'US': 'H', 'SS': 'h', 'UL': 'I', 'SL': 'i', 'FL': 'f', 'FD': 'd', 'SV': 'q', 'UV': 'Q'}
+_TEXT_VRS = {'AE', 'AS', 'CS', 'DA', 'DT', 'LO', 'PN', 'SH', 'TM', 'UC', 'UI'}
+_SINGLE_TEXT_VRS = {'LT', 'ST', 'UR', 'UT'}
+
+
+class _FastPathFailed(Exception):
+    """ Raised by the prefix header parser if the file cannot be handled without pydicom.
+    """
+    pass
+
+
+def _keyword_tags(keywords: Tuple[str, ...]) -> Dict[int, str]:
+    """ Maps DICOM keywords to tags.
+    :param keywords: DICOM keywords, e.g. 'Rows'
+    :return: dictionary mapping tags to keywords
+    """
+    from pydicom.datadict import tag_for_keyword
+
+    tags = {}
+    for keyword in keywords:
+        tag = tag_for_keyword(keyword)
+        if tag is None:
+            raise ValueError(f"Unknown DICOM keyword: {keyword}")
+        tags[tag] = keyword
+    return tags
+
+
+def _read_element_header(buf: bytes, offset: int, explicit: bool, endian: str) -> Tuple[int, str, int, int]:
+    """ Reads the header of the data element at the given offset.
+    :return: (tag, vr, length, value_offset) where vr is None for implicit VR or item elements
+    """
+    from struct import unpack_from
+
+    if offset + 8 > len(buf):
+        raise _FastPathFailed()
+    group, element = unpack_from(endian + 'HH', buf, offset)
+    tag = group << 16 | element
+    if not explicit or group == 0xFFFE:
+        return tag, None, unpack_from(endian + 'I', buf, offset + 4)[0], offset + 8
+
+    vr = buf[offset + 4:offset + 6].decode('ascii')
+    if vr in _LONG_VRS:
+        if offset + 12 > len(buf):
+            raise _FastPathFailed()
+        return tag, vr, unpack_from(endian + 'I', buf, offset + 8)[0], offset + 12
+    return tag, vr, unpack_from(endian + 'H', buf, offset + 6)[0], offset + 8
+
+
+def _skip_undefined_length(buf: bytes, offset: int, explicit: bool, endian: str, end_tag: int) -> int:
+    """ Skips the content of an undefined length sequence or item.
+    :param offset: offset of the first element inside the sequence or item
+    :param end_tag: tag of the delimitation element that ends the sequence or item
+    :return: offset of the first byte after the delimitation element
+    """
+    while True:
+        tag, vr, length, offset = _read_element_header(buf, offset, explicit, endian)
+        if tag == end_tag:
+            return offset
+        if length != _UNDEFINED_LENGTH:
+            offset += length
+        elif tag == _ITEM:
+            offset = _skip_undefined_length(buf, offset, explicit, endian, _ITEM_DELIMITATION)
+        else:
+            # The content of undefined length UN elements is always encoded as implicit VR
+            offset = _skip_undefined_length(buf, offset, explicit and vr != 'UN', endian, _SEQUENCE_DELIMITATION)
+
+
+def _decode_value(raw: bytes, vr: str, endian: str):
+    """ Decodes the raw value of a data element with the given VR.
+    :return: a single value, a list of values if the element is multi-valued or None if empty
+    """
+    from struct import unpack_from, calcsize
+
+    if vr in _BINARY_VRS:
+        fmt = _BINARY_VRS[vr]
+        count = len(raw) // calcsize(fmt)
+        values = list(unpack_from(f"{endian}{count}{fmt}", raw))
+    elif vr in ('IS', 'DS') or vr in _TEXT_VRS:
+        values = [value.strip(' \x00') for value in raw.decode('latin-1').split('\\')]
+        if vr == 'IS':
+            values = [int(value) for value in values if value]
+        elif vr == 'DS':
+            values = [float(value) for value in values if value]
+        else:
+            values = [value for value in values if value]
+    elif vr in _SINGLE_TEXT_VRS:
+        value = raw.decode('latin-1').rstrip(' \x00')
+        return value if value else None
+    else:
+        return raw if raw else None
+
+    if not values:
+        return None
+    return values[0] if len(values) == 1 else values
+
+
+def _parse_header_prefix(buf: bytes, tags: Dict[int, str], eof: bool) -> Dict[str, Any]:
+    """ Parses the requested data elements from the beginning of a DICOM file.
+    Parsing stops at the first element past the requested tags, so pixel data is never touched.
+    :param buf: the first bytes of the DICOM file
+    :param tags: dictionary mapping the requested tags to their keywords
+    :param eof: True if `buf` contains the whole file
+    :return: dictionary mapping keywords to values, missing elements are None
+    """
+    from pydicom.datadict import dictionary_VR
+
+    if buf[128:132] != b'DICM':
+        raise _FastPathFailed()
+
+    values = {keyword: None for keyword in tags.values()}
+    last_tag = max(tags)
+
+    # File meta information is always explicit VR little endian
+    offset = 132
+    transfer_syntax = None
+    while offset < len(buf):
+        tag, vr, length, value_offset = _read_element_header(buf, offset, True, '<')
+        if tag >> 16 != 0x0002:
+            break
+        if value_offset + length > len(buf):
+            raise _FastPathFailed()
+        raw = buf[value_offset:value_offset + length]
+        if tag == 0x00020010:
+            transfer_syntax = raw.decode('ascii').strip(' \x00')
+        if tag in tags:
+            values[tags[tag]] = _decode_value(raw, vr, '<')
+        offset = value_offset + length
+
+    if transfer_syntax is None or transfer_syntax == _DEFLATED_EXPLICIT_VR_LITTLE_ENDIAN:
+        raise _FastPathFailed()
+    explicit = transfer_syntax != _IMPLICIT_VR_LITTLE_ENDIAN
+    endian = '>' if transfer_syntax == _EXPLICIT_VR_BIG_ENDIAN else '<'
+
+    pixel_representation = None
+    while True:
+        if offset == len(buf) and eof:
+            break
+        tag, vr, length, value_offset = _read_element_header(buf, offset, explicit, endian)
+        if tag > last_tag:
+            break
+        if length == _UNDEFINED_LENGTH:
+            offset = _skip_undefined_length(buf, value_offset, explicit and vr != 'UN', endian,
+                                            _SEQUENCE_DELIMITATION)
+            continue
+        if value_offset + length > len(buf):
+            raise _FastPathFailed()
+
+        if tag in tags or tag == _PIXEL_REPRESENTATION:
+            if vr is None:
+                vr = dictionary_VR(tag)
+                if vr == 'US or SS':
+                    if pixel_representation is None:
+                        raise _FastPathFailed()
+                    vr = 'SS' if pixel_representation else 'US'
+            value = _decode_value(buf[value_offset:value_offset + length], vr, endian)
+            if tag == _PIXEL_REPRESENTATION:
+                pixel_representation = value
+            if tag in tags:
+                values[tags[tag]] = value
+        offset = value_offset + length
+
+    return values
+
+
+def read_header(dcm_filename: str, keywords: Tuple[str, ...] = META_KEYWORDS,
+                max_bytes: int = HEADER_PREFIX_SIZE) -> Dict[str, Any]:
+    """ Reads the given data elements from the header of a DICOM file.
+    Only the first `max_bytes` bytes of the file are read and parsing stops at the first element past the requested
+    ones. If this is not sufficient (e.g. a large header or an unsupported transfer syntax), pydicom is used instead.
+    :param dcm_filename: path to DICOM file to read the header from
+    :param keywords: DICOM keywords of the data elements to read, e.g. ('Rows', 'Columns')
+    :param max_bytes: maximum number of bytes to read with the fast parser. If 0, pydicom is used directly.
+    :return: dictionary mapping the keywords to the values, values of missing elements are None
+    """
+    from struct import error as StructError
+
+    tags = _keyword_tags(tuple(keywords))
+
+    if max_bytes > 0:
+        with open(dcm_filename, 'rb') as fh:
+            buf = fh.read(max_bytes)
+        try:
+            return _parse_header_prefix(buf, tags, eof=len(buf) < max_bytes)
+        except (_FastPathFailed, StructError, UnicodeDecodeError, ValueError):
+            pass
+
+    from pydicom import dcmread
+    # PixelRepresentation is needed to decode 'US or SS' elements like SmallestImagePixelValue
+    dcm = dcmread(dcm_filename, stop_before_pixels=True, specific_tags=[*keywords, 'PixelRepresentation'])
+    return {keyword: dcm.file_meta.get(keyword) if tag >> 16 == 0x0002 else dcm.get(keyword)
+            for tag, keyword in tags.items()}
+
+
+def read_meta(dcm_filename: str, max_bytes: int = HEADER_PREFIX_SIZE) -> Tuple[int, int, int, int]:
     """ Reads the meta data from the DICOM file and returns the width, height
     and the minimum and maximum pixel values.
     :param dcm_filename: path to DICOM file to read meta data from
+    :param max_bytes: maximum number of bytes to read with the fast header parser, see `read_header()`
     :return: (width, height, minPixelValue, maxPixelValue)
     """
-    from pydicom import dcmread
-    dcm = dcmread(dcm_filename, stop_before_pixels=True)
-    return dcm.Columns, dcm.Rows, dcm.SmallestImagePixelValue, dcm.LargestImagePixelValue
+    header = read_header(dcm_filename, META_KEYWORDS, max_bytes)
+    for keyword in META_KEYWORDS:
+        if header[keyword] is None:
+            raise AttributeError(f"'{dcm_filename}' has no data element '{keyword}'")
+    return tuple(header[keyword] for keyword in META_KEYWORDS)
 
 
 def list_files(dir: str, recursive: bool = False) -> Generator[pathlib.Path, None, None]:
@@ -30,53 +249,570 @@ def list_files(dir: str, recursive: bool = False) -> Generator[pathlib.Path, Non
         yield p
 
 
-def list_meta(dir: str, recursive: bool = False) -> Generator[Tuple[str, int, int, int, int], None, None]:
+def _parallel_map(func: Callable[[T], R], items: Iterable[T], workers: int = 0, chunksize: int = 16,
+                  ordered: bool = False, threads: bool = False, initializer: Optional[Callable] = None,
+                  initargs: Tuple = ()) -> Generator[R, None, None]:
+    """ Applies `func` to all items, optionally using a pool of worker processes or threads.
+    The items are consumed lazily, so a generator that walks a directory tree is only traversed once.
+    :param func: function to apply, must be picklable (i.e. defined at module level) when using processes
+    :param items: iterable of items to apply `func` to
+    :param workers: number of workers to use. If 0 (default), `func` is applied serially in the calling process.
+    :param chunksize: number of items sent to a worker at once
+    :param ordered: if True, results are yielded in input order, otherwise as soon as they are available
+    :param threads: if True, use a thread pool instead of a process pool
+    :param initializer: if given, called with `initargs` by each worker on startup, not used if `workers` is 0
+    :param initargs: arguments for `initializer`
+    :return: Generator over the results
+    """
+    if not workers:
+        for item in items:
+            yield func(item)
+        return
+
+    if threads:
+        from multiprocessing.pool import ThreadPool as Pool
+    else:
+        from multiprocessing import Pool
+
+    with Pool(workers, initializer=initializer, initargs=initargs) as pool:
+        imap = pool.imap if ordered else pool.imap_unordered
+        for result in imap(func, items, chunksize=max(1, chunksize)):
+            yield result
+
+
+def _supervised_worker(func: Callable[[T], R], connection, initializer: Optional[Callable], initargs: Tuple):
+    """ Main function of the worker processes of `_supervised_map()`. Applies `func` to the items of the received
+    chunks until it receives None, and sends back a (succeeded, result or exception) pair per item.
+    """
+    if initializer is not None:
+        initializer(*initargs)
+    for chunk in iter(connection.recv, None):
+        for item in chunk:
+            try:
+                message = True, func(item)
+            except Exception as e:
+                message = False, e
+            connection.send(message)
+
+
+class _SupervisedWorker:
+    """ Worker process of `_supervised_map()` together with the items it has not answered yet.
+    """
+
+    def __init__(self, func: Callable, initializer: Optional[Callable], initargs: Tuple):
+        from collections import deque
+        from multiprocessing import Pipe, Process
+
+        self.connection, child_connection = Pipe()
+        self.process = Process(target=_supervised_worker, args=(func, child_connection, initializer, initargs),
+                               daemon=True)
+        self.process.start()
+        child_connection.close()
+        # (position, item) pairs that were sent to the worker but not answered yet
+        self.pending = deque()
+        self.deadline = None
+
+    def send(self, chunk: List[Tuple[int, Any]], timeout: Optional[float]):
+        import time
+
+        self.pending.extend(chunk)
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.connection.send([item for _, item in chunk])
+
+    def stop(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+def _supervised_map(func: Callable[[T], R], items: Iterable[T], failed: Callable[[T, Optional[int]], R],
+                    workers: int = 1, chunksize: int = 1, ordered: bool = False, timeout: Optional[float] = None,
+                    initializer: Optional[Callable] = None, initargs: Tuple = ()) -> Generator[R, None, None]:
+    """ Applies `func` to all items in worker processes that are monitored by the calling process, see
+    `_parallel_map()`. Unlike the workers of a `multiprocessing.Pool`, a worker that exceeds the time limit is killed,
+    and a worker that dies (e.g. killed by the OOM killer or crashed inside of a C extension) does not hang the map.
+    In both cases the result of the current item is `failed(item, exitcode)` and a new worker takes over the remaining
+    items of the chunk.
+    :param func: function to apply, must be picklable (i.e. defined at module level)
+    :param items: iterable of items to apply `func` to, consumed lazily
+    :param failed: function returning the result of an item given the exit code of its worker, or None if the worker
+        was killed because it exceeded the time limit. Called in the calling process.
+    :param workers: number of worker processes, at least 1
+    :param chunksize: number of items sent to a worker at once
+    :param ordered: if True, results are yielded in input order, otherwise as soon as they are available
+    :param timeout: if given, wall-clock time limit in seconds per item
+    :param initializer: if given, called with `initargs` by each worker on startup
+    :param initargs: arguments for `initializer`
+    :return: Generator over the results
+    """
+    import time
+    from collections import deque
+    from itertools import islice
+    from multiprocessing.connection import wait
+
+    items = enumerate(items)
+    chunksize = max(1, chunksize)
+    # (position, item) pairs of the chunks of failed workers, sent again before any new items
+    retry = deque()
+    pool = []
+    # Results that are not yielded yet, by position if ordered
+    results = {}
+    next_position = 0
+
+    def next_chunk() -> List[Tuple[int, Any]]:
+        chunk = []
+        while retry and len(chunk) < chunksize:
+            chunk.append(retry.popleft())
+        chunk.extend(islice(items, chunksize - len(chunk)))
+        return chunk
+
+    try:
+        while True:
+            # Keep all workers busy, new workers are only started as long as there are items left
+            for worker in pool + [None] * (max(1, workers) - len(pool)):
+                if worker is None or not worker.pending:
+                    chunk = next_chunk()
+                    if not chunk:
+                        break
+                    if worker is None:
+                        worker = _SupervisedWorker(func, initializer, initargs)
+                        pool.append(worker)
+                    worker.send(chunk, timeout)
+            busy = [worker for worker in pool if worker.pending]
+            if not busy:
+                break
+
+            deadlines = [worker.deadline for worker in busy if worker.deadline is not None]
+            wait([worker.connection for worker in busy] + [worker.process.sentinel for worker in busy],
+                 max(0.0, min(deadlines) - time.monotonic()) if deadlines else None)
+
+            for worker in busy:
+                while worker.pending and worker.connection.poll():
+                    try:
+                        succeeded, result = worker.connection.recv()
+                    except (EOFError, OSError):
+                        # The worker died, its last message might be incomplete
+                        break
+                    if not succeeded:
+                        raise result
+                    results[worker.pending.popleft()[0]] = result
+                    worker.deadline = time.monotonic() + timeout if timeout else None
+
+                expired = worker.deadline is not None and time.monotonic() >= worker.deadline
+                if worker.pending and (expired or not worker.process.is_alive()):
+                    exitcode = None if worker.process.is_alive() else worker.process.exitcode
+                    worker.stop()
+                    pool.remove(worker)
+                    position, item = worker.pending.popleft()
+                    results[position] = failed(item, exitcode)
+                    retry.extendleft(reversed(worker.pending))
+                elif not worker.pending and not worker.process.is_alive():
+                    worker.stop()
+                    pool.remove(worker)
+
+            if ordered:
+                while next_position in results:
+                    yield results.pop(next_position)
+                    next_position += 1
+            else:
+                yield from results.values()
+                results.clear()
+    finally:
+        for worker in pool:
+            worker.stop()
+
+
+def _indexed_call(func: Callable[[pathlib.Path], R], item: Tuple[int, pathlib.Path, int, int]) \
+        -> Tuple[int, pathlib.Path, int, int, R]:
+    """ Calls `func` for the file of the given (position, file, size, mtime_ns) item.
+    :return: (position, file, size, mtime_ns, result) tuple
+    """
+    position, file, size, mtime_ns = item
+    return position, file, size, mtime_ns, func(file)
+
+
+def _indexed_map(func: Callable[[pathlib.Path], R], files: Iterable[pathlib.Path],
+                 get: Callable[[pathlib.Path, int, int], Optional[R]],
+                 put: Callable[[pathlib.Path, int, int, R], None],
+                 map_func: Callable[..., Generator] = _parallel_map, **kwargs) -> Generator[R, None, None]:
+    """ Applies `func` to all files that have no valid cached result, see `_parallel_map()`.
+    Cached results are not sent to the workers, they are yielded in between the computed results (in the order of
+    `files` if `ordered` is True).
+    :param func: function to apply, must be picklable when using processes
+    :param files: files to apply `func` to
+    :param get: function returning the cached result of a file given its path, size and modification time, or None
+    :param put: function storing the result of a file given its path, size and modification time
+    :param map_func: `_parallel_map()` or `_supervised_map()`
+    :param kwargs: passed to `map_func`. The `failed` function of `_supervised_map()` is called with the file.
+    :return: Generator over the (cached or computed) results
+    """
+    from collections import deque
+    from functools import partial
+
+    if 'failed' in kwargs:
+        failed = kwargs['failed']
+        kwargs['failed'] = lambda item, exitcode: (*item, failed(item[1], exitcode))
+
+    ordered = kwargs.get('ordered', False)
+    # (position, result) pairs of the cached results in the order of `files`. The files are looked up while the
+    # pool consumes the items, i.e. possibly in another thread, deques are thread-safe.
+    hits = deque()
+
+    def lookup():
+        for position, file in enumerate(files):
+            stat = file.stat()
+            cached = get(file, stat.st_size, stat.st_mtime_ns)
+            if cached is None:
+                yield position, file, stat.st_size, stat.st_mtime_ns
+            else:
+                hits.append((position, cached))
+
+    for position, file, size, mtime_ns, result in map_func(partial(_indexed_call, func), lookup(), **kwargs):
+        # In order, all files before `position` have been looked up already
+        while hits and (not ordered or hits[0][0] < position):
+            yield hits.popleft()[1]
+        put(file, size, mtime_ns, result)
+        yield result
+    while hits:
+        yield hits.popleft()[1]
+
+
+def _file_meta(file: pathlib.Path) -> Tuple[str, int, int, int, int]:
+    """ Returns the meta data of the given DICOM file together with the filename.
+    :param file: path to the DICOM file
+    :return: (filename, width, height, minPixelValue, maxPixelValue)
+    """
+    return (file.name, *read_meta(str(file)))
+
+
+def iter_meta(files: Iterable[pathlib.Path], workers: int = 0, chunksize: int = 16, ordered: bool = False,
+              threads: bool = False, index: Optional[DicomIndex] = None) \
+        -> Generator[Tuple[str, int, int, int, int], None, None]:
+    """
+    List meta data (width, size, min and max pixel values) for the given DICOM files.
+    :param files: iterable of paths to DICOM files, e.g. as returned by `list_files()`
+    :param workers: number of parallel workers used to read the headers, 0 (default) reads them serially
+    :param chunksize: number of files sent to a worker at once
+    :param ordered: if True, keep the order of `files`, otherwise results are yielded as they arrive.
+        Has no effect if `workers` is 0.
+    :param threads: use threads instead of processes, useful when reading is bound by I/O latency
+    :param index: if given, only files that are not in the index or have changed are read. The index is updated
+        with the newly read meta data.
+    :return: Generator of Tuples of (filename, width, height, minPixelValue, maxPixelValue)
+    """
+    if index is None:
+        return _parallel_map(_file_meta, files, workers=workers, chunksize=chunksize, ordered=ordered,
+                             threads=threads)
+
+    def get(file, size, mtime_ns):
+        meta = index.get_meta(file, size, mtime_ns)
+        return (file.name, *meta) if meta is not None else None
+
+    def put(file, size, mtime_ns, meta):
+        index.put_meta(file, size, mtime_ns, meta[1:])
+
+    return _indexed_map(_file_meta, files, get, put, workers=workers, chunksize=chunksize, ordered=ordered,
+                        threads=threads)
+
+
+def list_meta(dir: str, recursive: bool = False, workers: int = 0, chunksize: int = 16, ordered: bool = False,
+              threads: bool = False, index: Optional[DicomIndex] = None) \
+        -> Generator[Tuple[str, int, int, int, int], None, None]:
     """
     List meta data (width, size, min and max pixel values) for all DICOM files
     inside the given directory (optionally including sub directories).
     :param dir: Path to a directory to look for DICOM files in
     :param recursive: If true: search in subdirectories
+    :param workers: number of parallel workers used to read the headers, 0 (default) reads them serially
+    :param chunksize: number of files sent to a worker at once
+    :param ordered: if True, keep the directory listing order, otherwise results are yielded as they arrive.
+        Has no effect if `workers` is 0.
+    :param threads: use threads instead of processes, useful when reading is bound by I/O latency
+    :param index: if given, only files that are not in the index or have changed are read, see `iter_meta()`
     :return: Generator of Tuples of (filename, width, height, minPixelValue, maxPixelValue)
     """
-    for file in list_files(dir, recursive):
-        meta = (file.name, *read_meta(str(file)))
-        yield meta
+    return iter_meta(list_files(dir, recursive), workers=workers, chunksize=chunksize, ordered=ordered,
+                     threads=threads, index=index)
 
 
-def is_corrupted(dcm_filename: str) -> bool:
+CHECK_LEVELS = ('structure', 'decode', 'full')
+
+# Failure categories reported by check_corruption()
+UNREADABLE = 'unreadable'
+INVALID_HEADER = 'invalid_header'
+MISSING_PIXEL_DATA = 'missing_pixel_data'
+PIXEL_DATA_LENGTH = 'pixel_data_length'
+DECODE_ERROR = 'decode_error'
+TIMEOUT = 'timeout'
+OUT_OF_MEMORY = 'out_of_memory'
+CRASHED = 'crashed'
+
+_PIXEL_DATA = 0x7FE00010
+
+
+def _check_structure(dcm_filename: str) -> Optional[str]:
+    """ Checks that the header can be parsed and the length of the pixel data matches the image dimensions.
+    The pixel data itself is not read.
+    :param dcm_filename: path to the DICOM file to check
+    :return: failure category or None if the file passed the check
     """
-    Checks if the given DICOM file is corrupted ot not, i.e. if the data array can be read or not/
-    :param fcm_filename: path to the DICOM file to check for corruption
-    :return: True iff the data array could NOT be read
+    import os
+    from pydicom import dcmread
+
+    try:
+        dcm = dcmread(dcm_filename, defer_size='1 KB')
+    except OSError:
+        return UNREADABLE
+    except Exception:
+        return INVALID_HEADER
+
+    if _PIXEL_DATA not in dcm:
+        return MISSING_PIXEL_DATA
+
+    try:
+        element = dcm.get_item(_PIXEL_DATA, keep_deferred=True)
+    except TypeError:
+        # pydicom < 3 always returns the raw (possibly deferred) element
+        element = dcm.get_item(_PIXEL_DATA)
+
+    transfer_syntax = dcm.file_meta.get('TransferSyntaxUID') if hasattr(dcm, 'file_meta') else None
+    if transfer_syntax is not None and transfer_syntax.is_compressed:
+        # The length of encapsulated pixel data does not depend on the image dimensions
+        return None
+
+    try:
+        bits = dcm.Rows * dcm.Columns * dcm.get('SamplesPerPixel', 1) * int(dcm.get('NumberOfFrames', 1) or 1) \
+               * dcm.BitsAllocated
+    except (AttributeError, TypeError, ValueError):
+        return INVALID_HEADER
+    expected_length = (bits + 7) // 8
+    # Values are padded to an even length
+    expected_lengths = (expected_length, expected_length + expected_length % 2)
+
+    if getattr(element, 'value', None) is None and hasattr(element, 'value_tell'):
+        # Deferred element: the value must be completely contained in the file
+        length = element.length
+        if element.value_tell + length > os.path.getsize(dcm_filename):
+            return PIXEL_DATA_LENGTH
+    else:
+        length = len(element.value)
+
+    return None if length in expected_lengths else PIXEL_DATA_LENGTH
+
+
+def _check_decode(dcm_filename: str) -> Optional[str]:
+    """ Checks that the pixel data can be decoded, frame by frame if supported by pydicom.
+    No additional copy of the decoded pixel data is made.
+    :param dcm_filename: path to the DICOM file to check
+    :return: failure category or None if the file passed the check
     """
+    try:
+        from pydicom.pixels import iter_pixels
+    except ImportError:
+        iter_pixels = None
+
+    if iter_pixels is not None:
+        try:
+            for _ in iter_pixels(dcm_filename):
+                pass
+        except MemoryError:
+            raise
+        except Exception:
+            return DECODE_ERROR
+        return None
+
     from pydicom import dcmread
-    import numpy as np
+    try:
+        _ = dcmread(dcm_filename).pixel_array
+    except MemoryError:
+        raise
+    except Exception:
+        return DECODE_ERROR
+    return None
+
+
+def _check_full(dcm_filename: str) -> Optional[str]:
+    """ Checks that the pixel data can be decoded and converted to int16.
+    :param dcm_filename: path to the DICOM file to check
+    :return: failure category or None if the file passed the check
+    """
+    from pydicom import dcmread
+
     try:
         dcm = dcmread(dcm_filename, stop_before_pixels=False)
         # access pixel array
         _ = dcm.pixel_array.astype(np.int16)
-        return False
-    except:
-        return True
+    except MemoryError:
+        raise
+    except Exception:
+        return DECODE_ERROR
+    return None
+
+
+def check_corruption(dcm_filename: str, level: str = 'full') -> Optional[str]:
+    """
+    Checks if the given DICOM file is corrupted and returns the reason.
+    The following check levels are available, each level includes the checks of the previous levels:
+        - 'structure': the header can be parsed and the length of the pixel data matches Rows x Columns x
+          BitsAllocated (x SamplesPerPixel x NumberOfFrames). The pixel data is not read.
+        - 'decode': the pixel data can be decoded. Frames are decoded one at a time if supported by pydicom.
+        - 'full': the pixel data can be decoded and converted to int16 (like `read_image()` users would do).
+    :param dcm_filename: path to the DICOM file to check for corruption
+    :param level: check level, one of `CHECK_LEVELS`
+    :return: None if the file passed the check, otherwise the failure category, one of UNREADABLE, INVALID_HEADER,
+        MISSING_PIXEL_DATA, PIXEL_DATA_LENGTH, DECODE_ERROR or OUT_OF_MEMORY
+    """
+    if level not in CHECK_LEVELS:
+        raise ValueError(f"Unknown check level: {level}. Supported levels are: {', '.join(CHECK_LEVELS)}")
+
+    try:
+        category = _check_structure(dcm_filename)
+        if category or level == 'structure':
+            return category
+        return _check_decode(dcm_filename) if level == 'decode' else _check_full(dcm_filename)
+    except MemoryError:
+        return OUT_OF_MEMORY
+    except OSError:
+        return UNREADABLE
+
+
+def is_corrupted(dcm_filename: str, level: str = 'full') -> bool:
+    """
+    Checks if the given DICOM file is corrupted ot not, i.e. if the data array can be read or not/
+    :param dcm_filename: path to the DICOM file to check for corruption
+    :param level: check level, see `check_corruption()`
+    :return: True iff the data array could NOT be read
+    """
+    return check_corruption(dcm_filename, level) is not None
 
 
-def find_corrupted(dir: str, recursive: bool = False) -> Generator[Tuple[bool, str], None, None]:
+def _limit_memory(memory_limit: int):
+    """ Limits the address space of the current (worker) process, so that allocations beyond the limit raise a
+    MemoryError instead of exhausting the memory of the machine. Does nothing on platforms without `resource`.
+    :param memory_limit: limit in bytes
+    """
+    try:
+        import resource
+    except ImportError:
+        return
+    # Import the decoders before the limit is set, so that the limit only applies to the checks
+    import pydicom
+    try:
+        import pydicom.pixels
+    except ImportError:
+        pass
+
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        memory_limit = min(memory_limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, hard))
+
+
+def _file_corruption(level: str, file: pathlib.Path) -> Tuple[Optional[str], str]:
+    """ Checks the given DICOM file for corruption, see `check_corruption()`.
+    :param level: check level
+    :param file: path to the DICOM file
+    :return: (failure_category, filename) where failure_category is None if the file passed the check
+    """
+    return check_corruption(str(file), level), file.name
+
+
+def _failed_check(file: pathlib.Path, exitcode: Optional[int]) -> Tuple[str, str]:
+    """ Returns the result of a file whose check did not finish, see `_supervised_map()`.
+    :param file: path to the DICOM file
+    :param exitcode: exit code of the worker process or None if the check exceeded the time limit
+    :return: (failure_category, filename) where failure_category is TIMEOUT, OUT_OF_MEMORY if the worker was killed
+        with SIGKILL (e.g. by the OOM killer) or CRASHED otherwise
+    """
+    import signal
+
+    if exitcode is None:
+        return TIMEOUT, file.name
+    return (OUT_OF_MEMORY if exitcode == -signal.SIGKILL else CRASHED), file.name
+
+
+def check_files(files: Iterable[pathlib.Path], level: str = 'full', workers: int = 0, chunksize: int = 1,
+                ordered: bool = False, timeout: Optional[float] = None, memory_limit: Optional[int] = None,
+                index: Optional[DicomIndex] = None) -> Generator[Tuple[Optional[str], str], None, None]:
+    """
+    Checks the given DICOM files for corruption.
+    The worker processes are monitored by the calling process: a worker that exceeds the time limit is killed and a
+    worker that dies (e.g. crashes in a decoder) is replaced, the file it was checking is reported as TIMEOUT,
+    OUT_OF_MEMORY or CRASHED (see `_failed_check()`).
+    :param files: iterable of paths to DICOM files, e.g. as returned by `list_files()`
+    :param level: check level, see `check_corruption()`
+    :param workers: number of worker processes, 0 (default) checks the files serially in the calling process unless
+        `timeout` or `memory_limit` is given, which require one worker process
+    :param chunksize: number of files sent to a worker at once
+    :param ordered: if True, keep the order of `files`, otherwise results are yielded as they arrive
+    :param timeout: if given, wall-clock time limit in seconds per file. Files exceeding the limit are reported as
+        TIMEOUT.
+    :param memory_limit: if given, limit of the address space of each worker process in bytes. Files exceeding the
+        limit are reported as OUT_OF_MEMORY.
+    :param index: if given, only files that are not in the index or have changed are checked. The index is updated
+        with the results of the new checks, except for timeouts, memory errors and crashes.
+    :return: Generator of (failure_category, filename) pairs, the category is None for intact files
+    """
+    from functools import partial
+
+    if level not in CHECK_LEVELS:
+        raise ValueError(f"Unknown check level: {level}. Supported levels are: {', '.join(CHECK_LEVELS)}")
+
+    func = partial(_file_corruption, level)
+    if workers or timeout or memory_limit:
+        map_func = _supervised_map
+        map_args = dict(failed=_failed_check, workers=max(1, workers), chunksize=chunksize, ordered=ordered,
+                        timeout=timeout)
+        if memory_limit:
+            map_args.update(initializer=_limit_memory, initargs=(memory_limit,))
+    else:
+        map_func = _parallel_map
+        map_args = dict(workers=0)
+
+    if index is None:
+        return map_func(func, files, **map_args)
+
+    def get(file, size, mtime_ns):
+        category = index.get_corruption(file, size, mtime_ns, level)
+        return (category or None, file.name) if category is not None else None
+
+    def put(file, size, mtime_ns, result):
+        # Timeouts, memory errors and crashes depend on the limits of the run, not (only) on the file
+        if result[0] not in (TIMEOUT, OUT_OF_MEMORY, CRASHED):
+            index.put_corruption(file, size, mtime_ns, level, result[0])
+
+    return _indexed_map(func, files, get, put, map_func=map_func, **map_args)
+
+
+def find_corrupted(dir: str, recursive: bool = False, index: Optional[DicomIndex] = None, level: str = 'full',
+                   workers: int = 0) -> Generator[Tuple[bool, str], None, None]:
     """
     List all corrupted DICOM files inside the given directory (optionally including sub directories).
     :param dir: Path to a directory to look for corrupted DICOM files in
     :param recursive: If True: search in subdirectories
+    :param index: if given, only files that are not in the index or have changed are checked, see `check_files()`
+    :param level: check level, see `check_corruption()`
+    :param workers: number of worker processes, 0 (default) checks the files serially
     :return: Generator of (is_corrupted, filename) pairs.
     """
-    for file in list_files(dir, recursive):
-        yield is_corrupted(str(file)), file.name
+    for category, filename in check_files(list_files(dir, recursive), level=level, workers=workers, index=index):
+        yield category is not None, filename
 
 
-def read_image(dcm_filename: str) -> np.array:
+def read_image(dcm_filename: str, cache: Optional[PixelCache] = None, downsample: Optional[int] = None) -> np.array:
     """ Read the pixel data from the given DICOM file
     :param dcm_filename: path to DICOM file to read the pixel data from
+    :param cache: if given, the decoded image is stored in and read from this cache. Cached images are returned as
+        read-only memory maps.
+    :param downsample: if given, the image is downsampled by this factor, see `pixel_cache.downsample_image()`
     :return: numpy array containing the pixel data
     """
+    if cache is not None:
+        return cache.read_image(dcm_filename, downsample)
+
     from pydicom import dcmread
 
     dcm = dcmread(dcm_filename)
+    if downsample:
+        return downsample_image(dcm.pixel_array, downsample)
     return dcm.pixel_array
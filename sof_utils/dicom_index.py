@@ -0,0 +1,164 @@
+""" Persistent index of DICOM meta data and corruption checks.
+"""
+
+import os
+import pathlib
+import sqlite3
+import threading
+from typing import Optional, Tuple, Union
+
+# Indices with another schema version are rebuilt when opened
+_SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    min_value INTEGER,
+    max_value INTEGER,
+    check_level TEXT,
+    corruption TEXT
+)
+"""
+
+_RESULT_COLUMNS = ("width", "height", "min_value", "max_value", "check_level", "corruption")
+
+# Number of updates after which the index is committed to disk
+_COMMIT_INTERVAL = 1000
+
+
+class DicomIndex:
+    """ On-disk SQLite index that caches the results of `dicom.read_meta()` and `dicom.check_corruption()`.
+    Entries are keyed by the absolute path of a file and are only valid as long as the size and the modification
+    time of the file do not change.
+    The index can be shared between the thread iterating over the files and the thread consuming the results.
+    """
+
+    def __init__(self, filename: Union[str, os.PathLike], rebuild: bool = False):
+        """ Opens (or creates) the index at the given location.
+        :param filename: path to the index file
+        :param rebuild: if True, all existing entries are discarded
+        """
+        pathlib.Path(filename).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(filename), check_same_thread=False)
+        self._lock = threading.Lock()
+        self._pending = 0
+        with self._lock:
+            version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+            if version != _SCHEMA_VERSION:
+                self._connection.execute("DROP TABLE IF EXISTS files")
+                self._connection.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+            self._connection.execute(_SCHEMA)
+            if rebuild:
+                self._connection.execute("DELETE FROM files")
+            self._connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """ Commits all pending updates and closes the index.
+        """
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+
+    def commit(self):
+        """ Writes all pending updates to disk.
+        """
+        with self._lock:
+            self._connection.commit()
+            self._pending = 0
+
+    def get_meta(self, file: pathlib.Path, size: int, mtime_ns: int) -> Optional[Tuple[int, int, int, int]]:
+        """ Returns the cached meta data of the given file.
+        :param file: path to the DICOM file
+        :param size: current size of the file in bytes
+        :param mtime_ns: current modification time of the file in nanoseconds
+        :return: (width, height, minPixelValue, maxPixelValue) or None if the file is not indexed or has changed
+        """
+        row = self._get(file, size, mtime_ns, "width, height, min_value, max_value")
+        return row if row is not None and row[0] is not None else None
+
+    def put_meta(self, file: pathlib.Path, size: int, mtime_ns: int, meta: Tuple[int, int, int, int]):
+        """ Stores the meta data of the given file.
+        :param file: path to the DICOM file
+        :param size: size of the file in bytes
+        :param mtime_ns: modification time of the file in nanoseconds
+        :param meta: (width, height, minPixelValue, maxPixelValue) as returned by `dicom.read_meta()`
+        """
+        self._put(file, size, mtime_ns, ("width", "height", "min_value", "max_value"), meta)
+
+    def get_corruption(self, file: pathlib.Path, size: int, mtime_ns: int, level: str) -> Optional[str]:
+        """ Returns the cached result of a corruption check of the given file.
+        :param file: path to the DICOM file
+        :param size: current size of the file in bytes
+        :param mtime_ns: current modification time of the file in nanoseconds
+        :param level: check level, see `dicom.CHECK_LEVELS`. Results of other levels are ignored.
+        :return: failure category, an empty string if the file is intact or None if the file has not been checked
+            at the given level or has changed
+        """
+        row = self._get(file, size, mtime_ns, "check_level, corruption")
+        return row[1] if row is not None and row[0] == level else None
+
+    def put_corruption(self, file: pathlib.Path, size: int, mtime_ns: int, level: str, category: Optional[str]):
+        """ Stores the result of a corruption check of the given file.
+        :param file: path to the DICOM file
+        :param size: size of the file in bytes
+        :param mtime_ns: modification time of the file in nanoseconds
+        :param level: check level, see `dicom.CHECK_LEVELS`
+        :param category: failure category as returned by `dicom.check_corruption()`, None if the file is intact
+        """
+        self._put(file, size, mtime_ns, ("check_level", "corruption"), (level, category or ''))
+
+    def prune(self, root: Union[None, str, os.PathLike] = None) -> int:
+        """ Removes the entries of all files that no longer exist.
+        :param root: if given, only entries below this directory are checked
+        :return: number of removed entries
+        """
+        with self._lock:
+            if root is None:
+                rows = self._connection.execute("SELECT path FROM files").fetchall()
+            else:
+                prefix = os.path.join(os.path.abspath(str(root)), '')
+                rows = self._connection.execute("SELECT path FROM files WHERE substr(path, 1, ?) = ?",
+                                                (len(prefix), prefix)).fetchall()
+            deleted = [(path,) for (path,) in rows if not os.path.exists(path)]
+            self._connection.executemany("DELETE FROM files WHERE path = ?", deleted)
+            self._connection.commit()
+        return len(deleted)
+
+    def _get(self, file: pathlib.Path, size: int, mtime_ns: int, columns: str) -> Optional[Tuple]:
+        with self._lock:
+            return self._connection.execute(f"SELECT {columns} FROM files WHERE path = ? AND size = ? AND mtime_ns = ?",
+                                            (_key(file), size, mtime_ns)).fetchone()
+
+    def _put(self, file: pathlib.Path, size: int, mtime_ns: int, columns: Tuple[str, ...], values: Tuple):
+        # Results stored for an older version of the file are discarded
+        updates = [f"{column} = excluded.{column}" for column in columns]
+        updates += [f"{column} = CASE WHEN size = excluded.size AND mtime_ns = excluded.mtime_ns "
+                    f"THEN {column} ELSE NULL END"
+                    for column in _RESULT_COLUMNS if column not in columns]
+        updates += ["size = excluded.size", "mtime_ns = excluded.mtime_ns"]
+        with self._lock:
+            self._connection.execute(
+                f"INSERT INTO files (path, size, mtime_ns, {', '.join(columns)}) "
+                f"VALUES (?, ?, ?, {', '.join('?' for _ in columns)}) "
+                f"ON CONFLICT(path) DO UPDATE SET {', '.join(updates)}",
+                (_key(file), size, mtime_ns, *values))
+            self._pending += 1
+            if self._pending >= _COMMIT_INTERVAL:
+                self._connection.commit()
+                self._pending = 0
+
+
+def _key(file: pathlib.Path) -> str:
+    """ Returns the index key of the given file, i.e. its absolute path.
+    """
+    return os.path.abspath(str(file))
@@ -1,9 +1,19 @@
-from typing import Tuple, Union, List, Set, Dict
+from typing import Tuple, Union, List, Set, Dict, Callable, Optional
 
-import tensorflow as tf
+from .grouping import assign_groups, load_assignment, save_assignment
+from .lazy_import import lazy_import
 
+# Imported on first use, so importing this module does not load TensorFlow
+tf = lazy_import('tensorflow')
 
-def export_images(dataset: tf.data.Dataset,
+# Name of the manifest file written into the target directory
+_MANIFEST_NAME = 'manifest.jsonl'
+
+# Number of examples per batch when scanning the ids and visits of a dataset
+_SCAN_BATCH_SIZE = 1024
+
+
+def export_images(dataset: 'tf.data.Dataset',
                   target_path: str,
                   format: str = 'png',
                   downsample_to: Tuple[Union[int, None], Union[int, None]] = (1, None),
@@ -15,13 +25,21 @@ def export_images(dataset: tf.data.Dataset,
                   num_groups: Union[None, int] = None,
                   max_group_size: Union[None, int] = None,
                   randomized_groups: bool = False,
-                  zip: bool = False):
+                  zip: bool = False,
+                  workers: int = 1,
+                  decode_image: 'Optional[Callable[[tf.Tensor], tf.Tensor]]' = None,
+                  resume: bool = False,
+                  batch_size: int = 1,
+                  group_seed: Optional[int] = None,
+                  group_strategy: str = 'file',
+                  group_assignment: Optional[str] = None,
+                  save_groups: Optional[str] = None):
     """ Export the given dataset to png images
     :param dataset: Dataset to export
     :param target_path: path where the images will be exported to.
     :param format: image format to use: png (default) or jpeg
     :param downsample_to: target (width, height) of exported image (defaults to (None, None)).
-        If one entry is None, it is inferred from the other one by keeping the aspect ratio.
+        If one entry is None, it is inferred from the other one by keeping the aspect ratio of each image.
         If booth entries are None, the original size is kept.
     :split_lr: if true (default is false), splits the image vertically into a left and a right part, i.e. two instead of
         one image files are written per example.
@@ -33,24 +51,59 @@ def export_images(dataset: tf.data.Dataset,
     :num_groups: number of groups the exported files should be split into. If both, `max_group_size` and `num_groups` are `None` no grouping will be performed.
     :max_group_size: maximum number of files per group. If both, `max_group_size` and `num_groups` are `None` no grouping will be performed.
     :randomized_groups: If true, file to group assignments will be random.
+    :group_seed: Seed for the random group assignment. Random assignments can only be reproduced (and resumed) if
+        a seed is given.
+    :group_strategy: Files that are always assigned to the same group: 'file' (each file separately, default), 'image'
+        (both sides of a radiograph) or 'id' (all visits and sides of an SOF ID), see `grouping.STRATEGIES`.
+    :group_assignment: Path to a .csv file written with `save_groups` (or `grouping.save_assignment()`) to reuse instead
+        of assigning the files to groups. Every exported file must be contained in the assignment.
+    :save_groups: Path to a .csv file the group assignment is written to.
     :zip: If true, write files into a zip file instead of a directory. If grouping is enabled, create one zip file per group.
+    :workers: number of images that are resized and encoded in parallel. If 0, the number is chosen automatically.
+        Files are always written by a single writer thread, so the output does not depend on this value.
+    :decode_image: function to decode the images if the dataset contains encoded images, e.g. the `decode_example`
+        method of the TFDS image feature. Defaults to `tf.io.decode_image`. Datasets loaded with
+        `decoders={'image': tfds.decode.SkipDecoding()}` are filtered before any image is decoded, so exporting a
+        subset only costs time proportional to the size of the subset.
+    :resume: If true, continue a previous export into the same target: items recorded in the manifest whose file (or
+        zip member) still exists with the recorded size and hash and that belong to the same group as before are
+        skipped, also if the size of the group (which is part of the file names) has changed. Raises a ValueError if
+        the export parameters (size, format, split/flip, grouping, zip) differ from the ones of the previous export.
+        A manifest (`manifest.jsonl` inside of `target_path`, or `<target_path>.manifest.jsonl` for a single zip file)
+        is written in any case.
+    :batch_size: If greater than 1, images with the same source size are resized in batches of this size. Up to
+        `batch_size - 1` decoded images are buffered per distinct source size and the images are exported in a
+        different order than they appear in the dataset.
     """
     from pathlib import Path
     from tqdm import tqdm
-    from math import ceil
     from zipfile import ZipFile
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Filtering only uses the id and visit features, so encoded images are not decoded for filtered examples
+    dataset = _filter_examples(dataset, visits, included_ids, excluded_ids)
+
+    if decode_image is None:
+        decode_image = lambda x: tf.io.decode_image(x, expand_animations=False)
+    encoded_images = dataset.element_spec['image'].dtype == tf.string
+
+    if resume and randomized_groups and group_seed is None and not group_assignment:
+        raise ValueError("Cannot resume an export with randomized groups without a group seed or a group assignment")
 
     groups = {}
     group_sizes = []
-    if num_groups or max_group_size:
+    if num_groups or max_group_size or group_assignment:
         groups, group_sizes = _group_items(dataset,
                                            num_groups=num_groups,
                                            max_group_size=max_group_size,
                                            randomized=randomized_groups,
                                            split_lr=split_lr,
-                                           visits=visits,
-                                           included_ids=included_ids,
-                                           excluded_ids=excluded_ids)
+                                           seed=group_seed,
+                                           strategy=group_strategy,
+                                           assignment=group_assignment)
+        if save_groups:
+            save_assignment(save_groups, groups)
 
     target_path = Path(target_path)
     if zip and not groups:
@@ -65,17 +118,23 @@ def export_images(dataset: tf.data.Dataset,
     else:
         raise ValueError(f"Unsupported image format: {format}. supported formats are: png, jpeg")
 
-    image_shape = next(iter(dataset))['image'].shape
-
-    # Compute missing downsample_to entry, if any
-    if not downsample_to[0] and not downsample_to[1]:
-        downsample_to = (image_shape[1], image_shape[0])
-    elif not downsample_to[0]:
-        ratio = float(downsample_to[1]) / float(image_shape[0])
-        downsample_to = (int(ceil(ratio * float(image_shape[0]))), downsample_to[1])
-    elif not downsample_to[1]:
-        ratio = float(downsample_to[0]) / float(image_shape[1])
-        downsample_to = (downsample_to[0], int(ceil(ratio * float(image_shape[1]))))
+    parameters = {
+        'format': format.lower(),
+        'size': [downsample_to[0] or None, downsample_to[1] or None],
+        'split_lr': split_lr,
+        'flip_lr': flip_lr,
+        'num_groups': num_groups,
+        'max_group_size': max_group_size,
+        'randomized_groups': randomized_groups,
+        'group_seed': group_seed,
+        'group_strategy': group_strategy,
+        'group_assignment': group_assignment,
+        'zip': zip
+    }
+    manifest = _Manifest(target_path.with_name(target_path.name + '.manifest.jsonl') if zip and not groups
+                         else target_path.joinpath(_MANIFEST_NAME))
+    done = manifest.resume(parameters) if resume else {}
+    manifest.open(parameters, append=bool(done))
 
     def group_prefix(sof_id, visit, lr):
         if not groups:
@@ -85,75 +144,408 @@ def export_images(dataset: tf.data.Dataset,
 
         return f"G{group:04d}-N{group_size}-"
 
+    def open_zip(path):
+        # Zip files containing valid items of a previous export are appended to, all other members are removed first,
+        # so items that are exported again do not end up as duplicate members
+        members = {entry['member'] for entry in done.values() if entry['file'] == manifest.relative(path)}
+        if not members:
+            return ZipFile(path, 'w')
+        _prune_zip(path, members)
+        return ZipFile(path, 'a')
+
+    def group_zip_path(group):
+        # The size of a group is part of the name of its zip file. If the size has changed since a previous export
+        # (e.g. an incremental export of more examples), the zip file of the previous export is continued.
+        recorded = {entry['file'] for entry in done.values() if entry.get('group') == group}
+        if len(recorded) == 1:
+            return manifest.path.parent.joinpath(recorded.pop())
+        return target_path.joinpath(f"{group:04d}-N{group_sizes[group]}.zip")
+
     if zip and not groups:
-        zip_file = ZipFile(target_path, 'w')
+        zip_file = open_zip(target_path)
+        zip_files = [zip_file]
+    elif zip:
+        zip_paths = [group_zip_path(group) for group in range(len(group_sizes))]
+        zip_files = [open_zip(path) for path in zip_paths]
     else:
-        zip_files = [ZipFile(target_path.joinpath(f"{group:04d}-N{group_sizes[group]}.zip"), 'w') for group in
-                     range(len(group_sizes))]
+        zip_files = []
+    # Names of the members of each zip file, a member is never written twice
+    zip_members = [set(zf.namelist()) for zf in zip_files]
 
-    def write_file(filename, bytes, group=None):
+    def location(filename, group=None):
+        """ Returns the (file, zip member) pair an image with the given filename is written to
+        """
         if not zip:
-            with open(str(filename), 'wb') as f:
-                f.write(bytes)
+            return filename, None
         elif not groups:
-            zip_file.writestr(filename.name, bytes)
+            return target_path, filename.name
         else:
-            zf = zip_files[group]
-            zf.writestr(filename.name, bytes)
+            return zip_paths[group], filename.name
 
-    for example in tqdm(dataset):
-        if "id" in example:
-            sof_id = example['id'].numpy()
-            visit = example['visit'].numpy()
+    def write_file(key, filename, bytes, group=None):
+        if not zip:
+            with open(str(filename), 'wb') as f:
+                f.write(bytes)
         else:
-            sof_id = example['image/id'].numpy()
-            visit = example['image/visit'].numpy()
-        if visits and visit not in visits:
-            continue
-        if included_ids and sof_id not in included_ids or sof_id in excluded_ids:
-            continue
-
-        image = tf.cast(tf.image.resize(example['image'], (downsample_to[1], downsample_to[0])), dtype=tf.uint8)
-
+            index = group if groups else 0
+            if filename.name in zip_members[index]:
+                # The dataset contains the example more than once, the first one is kept
+                return
+            zip_files[index].writestr(filename.name, bytes)
+            zip_members[index].add(filename.name)
+        manifest.add(key, *location(filename, group), bytes, group)
+
+    def decode(example):
+        image = decode_image(example['image']) if encoded_images else example['image']
+        return _example_id(example), _example_visit(example), image
+
+    def resize(sof_id, visit, image):
+        # Works on single images as well as on batches of images with the same shape
+        shape = tf.shape(image)
+        target_size = _target_size(shape[-3], shape[-2], downsample_to)
+        image = tf.cast(tf.image.resize(image, target_size), dtype=tf.uint8)
         if split_lr:
-            left_img, right_img = split_image_lr(image, flip_lr)
-            postfix = f"-{left_img.shape[1]}x{left_img.shape[0]}"
-            # write left image, ie.e right hip
-            key = (sof_id, visit, 'R')
-            group = groups[key] if groups else None
-            pref = group_prefix(*key)
-            filename = target_path.joinpath(f'{pref}{sof_id}V{visit}R{postfix}.png')
-            encoded_image = encoding_func(left_img)
-            write_file(filename, encoded_image.numpy(), group)
-
-            # write right image, i.e. left hip
-            key = (sof_id, visit, 'L')
-            group = groups[key] if groups else None
-            pref = group_prefix(*key)
-            filename = target_path.joinpath(f'{pref}{sof_id}V{visit}L{postfix}.png')
-            encoded_image = encoding_func(right_img)
-            write_file(filename, encoded_image.numpy(), group)
+            images = split_image_lr(image, flip_lr)
         else:
-            postfix = f"-{image.shape[1]}x{image.shape[0]}"
-            key = (sof_id, visit, '')
-            group = groups[key] if groups else None
-            pref = group_prefix(*key)
-            filename = target_path.joinpath(f'{pref}{sof_id}V{visit}{postfix}.png')
-            encoded_image = encoding_func(image)
-            write_file(filename, encoded_image.numpy(), group)
+            images = (image,)
+        return sof_id, visit, images
 
+    def encode(sof_id, visit, images):
+        # The size of the exported image(s) is part of the file name
+        shape = tf.shape(images[0])
+        return sof_id, visit, tuple(encoding_func(image) for image in images), shape[1], shape[0]
 
-def split_image_lr(image: tf.Tensor, flip_lr: bool = False) -> Tuple[tf.Tensor, tf.Tensor]:
+    if split_lr:
+        # write left image, ie.e right hip, then right image, i.e. left hip
+        sides = ('R', 'L')
+    else:
+        sides = ('',)
+
+    def file_stem_and_group(key):
+        """ Returns the path of the file without the size postfix and the group of the given item
+        """
+        group = groups[key] if groups else None
+        pref = group_prefix(*key)
+        sof_id, visit, side = key
+        return target_path.joinpath(f'{pref}{sof_id}V{visit}{side}'), group
+
+    def is_done(key):
+        entry = done.get(manifest.key(key))
+        if entry is None or (groups and key not in groups):
+            return False
+        # The export parameters are unchanged, so a valid item only has to be exported again if it has been assigned
+        # to another group. Items keep their file names if the size of their group has changed.
+        group = groups[key] if groups else None
+        if entry.get('group') != group:
+            return False
+        if zip:
+            return entry['file'] == manifest.relative(zip_paths[group] if groups else target_path)
+        return True
+
+    if done:
+        # Skip examples whose images have all been exported before, without decoding them
+        finished = {(sof_id, visit) for (sof_id, visit, _) in done
+                    if all(is_done((sof_id, visit, side)) for side in sides)}
+        dataset = _exclude_examples(dataset, finished)
+
+    num_parallel_calls = workers if workers else tf.data.AUTOTUNE
+    decoded = dataset.map(decode, num_parallel_calls=num_parallel_calls)
+    if batch_size > 1:
+        # Resize images with the same shape together. Images are buffered per shape until a batch is complete, so the
+        # order of the exported images may differ from the order of the dataset.
+        resized = decoded \
+            .group_by_window(key_func=_shape_key,
+                             reduce_func=lambda key, window: window.batch(batch_size),
+                             window_size=batch_size) \
+            .map(resize, num_parallel_calls=num_parallel_calls) \
+            .unbatch()
+    else:
+        resized = decoded.map(resize, num_parallel_calls=num_parallel_calls)
+    encoded = resized \
+        .map(encode, num_parallel_calls=num_parallel_calls) \
+        .prefetch(max(2, 2 * workers) if workers else tf.data.AUTOTUNE)
+
+    # Encoded images are written by a single thread, which is required for zip files and keeps the file order of
+    # the serial export. The number of pending writes is bounded to limit the memory usage.
+    max_pending_writes = max(4, 4 * workers)
+    pending_writes = deque()
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        def submit(key, filename, bytes, group):
+            if len(pending_writes) >= max_pending_writes:
+                pending_writes.popleft().result()
+            pending_writes.append(writer.submit(write_file, key, filename, bytes, group))
+
+        for sof_id, visit, images, width, height in tqdm(encoded):
+            sof_id = sof_id.numpy()
+            visit = visit.numpy()
+            postfix = f"-{width.numpy()}x{height.numpy()}"
+
+            for index, side in enumerate(sides):
+                key = (sof_id, visit, side)
+                if done and is_done(key):
+                    continue
+                stem, group = file_stem_and_group(key)
+                submit(key, stem.with_name(f'{stem.name}{postfix}.png'), images[index].numpy(), group)
+
+        while pending_writes:
+            pending_writes.popleft().result()
+
+    for zf in zip_files:
+        zf.close()
+    manifest.close()
+
+
+def _example_id(example: 'Dict[str, tf.Tensor]') -> 'tf.Tensor':
+    """ Returns the SOF ID of the given example, supporting both, the 'id' and the 'image/id' key.
+    """
+    return example['id'] if 'id' in example else example['image/id']
+
+
+def _example_visit(example: 'Dict[str, tf.Tensor]') -> 'tf.Tensor':
+    """ Returns the visit of the given example, supporting both, the 'visit' and the 'image/visit' key.
+    """
+    return example['visit'] if 'visit' in example else example['image/visit']
+
+
+def _filter_examples(dataset: 'tf.data.Dataset',
+                     visits: List[int],
+                     included_ids: Set[int],
+                     excluded_ids: Set[int]) -> 'tf.data.Dataset':
+    """ Removes all examples from the dataset that should not be exported.
+    :param dataset: Dataset to filter
+    :param visits: visits to include, if empty all visits are included
+    :param included_ids: set of SOF IDs to include, if empty all IDs will be included
+    :param excluded_ids: set of SOF IDs to exclude
+    :return: filtered dataset
+    """
+    if not visits and not included_ids and not excluded_ids:
+        return dataset
+
+    def contains(values, value):
+        values = tf.constant(sorted(values), dtype=value.dtype)
+        return tf.reduce_any(tf.equal(values, value))
+
+    def predicate(example):
+        sof_id = _example_id(example)
+        visit = _example_visit(example)
+        keep = tf.constant(True)
+        if visits:
+            keep = tf.logical_and(keep, contains(visits, visit))
+        if included_ids:
+            keep = tf.logical_and(keep, contains(included_ids, sof_id))
+        if excluded_ids:
+            keep = tf.logical_and(keep, tf.logical_not(contains(excluded_ids, sof_id)))
+        return keep
+
+    return dataset.filter(predicate)
+
+
+def _target_size(height: 'tf.Tensor', width: 'tf.Tensor',
+                 downsample_to: Tuple[Union[int, None], Union[int, None]]) -> 'tf.Tensor':
+    """ Computes the target size of an image with the given source size.
+    :param height: source height
+    :param width: source width
+    :param downsample_to: target (width, height), see `export_images()`
+    :return: target (height, width) as int32 tensor
+    """
+    def scaled(target, source, other):
+        ratio = tf.cast(target, tf.float64) / tf.cast(source, tf.float64)
+        return tf.cast(tf.math.ceil(ratio * tf.cast(other, tf.float64)), tf.int32)
+
+    target_width, target_height = downsample_to
+    if not target_width and not target_height:
+        return tf.stack([tf.cast(height, tf.int32), tf.cast(width, tf.int32)])
+    elif not target_width:
+        return tf.stack([tf.constant(target_height, tf.int32), scaled(target_height, height, width)])
+    elif not target_height:
+        return tf.stack([scaled(target_width, width, height), tf.constant(target_width, tf.int32)])
+    return tf.constant([target_height, target_width], tf.int32)
+
+
+def _shape_key(sof_id: 'tf.Tensor', visit: 'tf.Tensor', image: 'tf.Tensor') -> 'tf.Tensor':
+    """ Returns a key that is unique for each image shape (height, width), used to batch images of equal shapes.
+    """
+    shape = tf.shape(image, out_type=tf.int64)
+    return shape[0] * (2 ** 32) + shape[1]
+
+
+def _exclude_examples(dataset: 'tf.data.Dataset', excluded: Set[Tuple[int, int]]) -> 'tf.data.Dataset':
+    """ Removes the examples with the given (id, visit) pairs from the dataset, without decoding any image.
+    :param dataset: Dataset to filter
+    :param excluded: set of (id, visit) pairs to remove
+    :return: filtered dataset
+    """
+    if not excluded:
+        return dataset
+
+    def example_key(sof_id, visit):
+        return tf.strings.join([tf.strings.as_string(sof_id), tf.strings.as_string(visit)], separator='V')
+
+    keys = tf.constant([f"{sof_id}V{visit}" for sof_id, visit in sorted(excluded)])
+    table = tf.lookup.StaticHashTable(tf.lookup.KeyValueTensorInitializer(keys, tf.ones_like(keys, dtype=tf.int32)),
+                                      default_value=0)
+
+    return dataset.filter(
+        lambda example: tf.equal(table.lookup(example_key(_example_id(example), _example_visit(example))), 0))
+
+
+class _Manifest:
+    """ Record of all items written by an export, stored in JSON lines format next to the exported files.
+    The first line contains the export parameters, all following lines one written item each, i.e. its key
+    (sof_id, visit, side), file, zip member, size and sha256 hash. If an item is listed multiple times, the last
+    entry is valid.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    @staticmethod
+    def key(key: Tuple[int, int, str]) -> Tuple[int, int, str]:
+        """ Returns the normalized (JSON compatible) form of an item key
+        """
+        return int(key[0]), int(key[1]), str(key[2])
+
+    def relative(self, file) -> str:
+        """ Returns the path of an exported file relative to the manifest
+        """
+        import os
+        return os.path.relpath(str(file), str(self.path.parent))
+
+    def resume(self, parameters: Dict) -> Dict[Tuple[int, int, str], Dict]:
+        """ Reads the manifest of a previous export and verifies the recorded items.
+        :param parameters: export parameters of the current export
+        :return: dictionary mapping keys to the entries of all valid items
+        """
+        import json
+
+        if not self.path.exists():
+            return {}
+
+        previous_parameters = None
+        entries = {}
+        with open(str(self.path), 'r') as fh:
+            for line in fh:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Incomplete last line of an interrupted export
+                    continue
+                if 'parameters' in record:
+                    previous_parameters = record['parameters']
+                else:
+                    entries[tuple(record['key'])] = record
+
+        if previous_parameters != parameters:
+            raise ValueError(f"Cannot resume export: export parameters have changed from {previous_parameters} "
+                             f"to {parameters}")
+
+        return {key: entry for key, entry in entries.items() if self._is_valid(entry)}
+
+    def _is_valid(self, entry: Dict) -> bool:
+        """ Checks if the recorded file (or zip member) exists and has the recorded size and hash
+        """
+        from hashlib import sha256
+        from zipfile import ZipFile, BadZipFile
+
+        file = self.path.parent.joinpath(entry['file'])
+        try:
+            if entry['member'] is None:
+                if file.stat().st_size != entry['size']:
+                    return False
+                data = file.read_bytes()
+            else:
+                with ZipFile(file, 'r') as zf:
+                    if zf.getinfo(entry['member']).file_size != entry['size']:
+                        return False
+                    data = zf.read(entry['member'])
+        except (OSError, KeyError, BadZipFile):
+            return False
+        return sha256(data).hexdigest() == entry['sha256']
+
+    def open(self, parameters: Dict, append: bool):
+        """ Opens the manifest for writing.
+        :param parameters: export parameters, written as first line of a new manifest
+        :param append: if True, append to the existing manifest instead of creating a new one
+        """
+        import json
+
+        self._file = open(str(self.path), 'a' if append else 'w')
+        if append and self._file.tell() > 0:
+            with open(str(self.path), 'rb') as fh:
+                fh.seek(-1, 2)
+                if fh.read(1) != b'\n':
+                    # Terminate the incomplete last line of an interrupted export
+                    self._file.write('\n')
+        if not append:
+            self._file.write(json.dumps({'parameters': parameters}) + '\n')
+            self._file.flush()
+
+    def add(self, key: Tuple[int, int, str], file, member: Optional[str], data: bytes, group: Optional[int]):
+        """ Records a written item.
+        :param key: (sof_id, visit, side) key of the item
+        :param file: path of the written file (or of the zip file)
+        :param member: name of the zip member, None if not written to a zip file
+        :param data: written data
+        :param group: group of the item, None if grouping is disabled
+        """
+        import json
+        from hashlib import sha256
+
+        entry = {
+            'key': list(self.key(key)),
+            'file': self.relative(file),
+            'member': member,
+            'size': len(data),
+            'sha256': sha256(data).hexdigest(),
+            'group': group
+        }
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+def _prune_zip(path, members: Set[str]):
+    """ Removes all members of a zip file except the given ones. Of members that are contained multiple times, the
+    last one is kept, which is the one that is read by `ZipFile.read()`.
+    :param path: path of the zip file
+    :param members: names of the members to keep
+    """
+    import os
+    from zipfile import ZipFile
+
+    with ZipFile(path, 'r') as zf:
+        infos = zf.infolist()
+        kept = {info.filename: info for info in infos if info.filename in members}
+        if len(kept) == len(infos):
+            return
+        temp_path = path.with_name(path.name + '.tmp')
+        with ZipFile(temp_path, 'w') as pruned:
+            for info in infos:
+                if kept.get(info.filename) is info:
+                    pruned.writestr(info, zf.read(info))
+    os.replace(str(temp_path), str(path))
+
+
+def split_image_lr(image: 'tf.Tensor', flip_lr: bool = False) -> 'Tuple[tf.Tensor, tf.Tensor]':
     """ Split image vertically into a left and a right image.
     If the image does not have an even width, it is padded by one column at the right.
+    Works on single images (height, width, channels) as well as on batches (batch, height, width, channels) and does
+    not require static shapes.
     :param image: source image to split
     :param flip_lr: If true, flips the right image vertically.
     :return: (left_image, right_image) tuple containing the left and the right half of the image.
     """
-    padding = image.shape[1] % 2
-    padded_image = tf.image.pad_to_bounding_box(image, 0, 0, image.shape[0], image.shape[1] + padding)
+    width = tf.shape(image)[-2]
+    padding = width % 2
+    paddings = [[0, 0]] * (image.shape.rank - 2) + [tf.stack([0, padding]), [0, 0]]
+    padded_image = tf.pad(image, tf.stack(paddings))
 
-    image_half_width = tf.cast(tf.math.ceil(padded_image.shape[1] / 2), tf.int64)
+    image_half_width = (width + padding) // 2
 
     left_image = padded_image[..., 0:image_half_width, :]
     right_image = padded_image[..., image_half_width:, :]
@@ -164,65 +556,53 @@ def split_image_lr(image: tf.Tensor, flip_lr: bool = False) -> Tuple[tf.Tensor,
     return left_image, right_image
 
 
-def _group_items(dataset: tf.data.Dataset,
+def _group_items(dataset: 'tf.data.Dataset',
                  max_group_size: Union[None, int],
                  num_groups: Union[None, int],
                  randomized: bool,
                  split_lr: bool,
-                 visits: List[int],
-                 included_ids: Set[int],
-                 excluded_ids: Set[int]) -> Tuple[Dict[Tuple[int, int, str], int], List[int]]:
+                 seed: Optional[int] = None,
+                 strategy: str = 'file',
+                 assignment: Optional[str] = None) -> Tuple[Dict[Tuple[int, int, str], int], List[int]]:
     """ Assigns each to be exported items to a group
-    :param dataset: Dataset
+    :param dataset: Dataset, already filtered with `_filter_examples()`
     :param max_group_size: Maximum group size, only when num_groups is not given
     :param num_groups: Maximum number of groups, only when max_group_size is not given
     :param randomized: If true, assigment will be random
     :param split_lr: Tf example images should be split in left and right images
-    :param visits: visits to include, if empty all visits are included
-    :param included_ids: list of SOF IDs to include, if empty all IDs will be included
-    :param excluded_ids: list of SOF IDs eo exclude
+    :param seed: seed for the random assignment
+    :param strategy: items that are assigned to the same group, see `grouping.STRATEGIES`
+    :param assignment: path to an assignment file to use instead of assigning the items, see
+        `grouping.load_assignment()`
     :return: (group_dict, group_size) tuple containing a group dictionary and a list of group sizes..
     """
     from tqdm import tqdm
-    from math import ceil
-    from random import sample
 
     splits = ['L', 'R'] if split_lr else ['']
 
-    # Generate item keys
+    # Generate item keys, only the id and visit features are read (and no images decoded if the dataset contains
+    # encoded images)
+    metadata = dataset \
+        .map(lambda example: (_example_id(example), _example_visit(example))) \
+        .batch(_SCAN_BATCH_SIZE)
     keys = []
-    for example in tqdm(dataset, desc='Scanning dataset', unit='example'):
-        sof_id = example['id'].numpy()
-        visit = example['visit'].numpy()
-
-        if included_ids and sof_id not in included_ids or sof_id in excluded_ids:
-            continue
-        if visits and visit not in visits:
-            continue
-
-        for split in splits:
-            key = (sof_id, visit, split)
-            keys.append(key)
-
-    if (not num_groups and not max_group_size) or (num_groups and max_group_size):
-        raise ValueError("Must set either num_groups or max_group_size")
-
-    # group items
-    num_items = len(keys)
-    num_groups = num_groups if num_groups else int(ceil(num_items / max_group_size))
-    max_group_size = max_group_size if max_group_size else int(ceil(num_items / num_groups))
-
-    group_sizes = [0 for i in range(num_groups)]
-
-    group_dict = {}
-    for key in keys:
-        available_groups = [i for i in range(num_groups) if group_sizes[i] < max_group_size]
-
-        assert available_groups
-
-        group = sample(available_groups, 1)[0] if randomized else available_groups[0]
-
+    for sof_ids, example_visits in tqdm(metadata, desc='Scanning dataset', unit=' batches'):
+        for sof_id, visit in zip(sof_ids.numpy(), example_visits.numpy()):
+            for split in splits:
+                keys.append((int(sof_id), int(visit), split))
+
+    if not assignment:
+        return assign_groups(keys, num_groups=num_groups, max_group_size=max_group_size, randomized=randomized,
+                             seed=seed, strategy=strategy)
+
+    assigned, _ = load_assignment(assignment)
+    missing = [key for key in keys if key not in assigned]
+    if missing:
+        raise ValueError(f"{len(missing)} exported files are not contained in the group assignment {assignment}, "
+                         f"e.g. {missing[0]}")
+    # Group sizes only count the exported files
+    group_dict = {key: assigned[key] for key in keys}
+    group_sizes = [0 for _ in range(max(group_dict.values(), default=-1) + 1)]
+    for group in group_dict.values():
         group_sizes[group] += 1
-        group_dict[key] = group
-
     return group_dict, group_sizes
@@ -0,0 +1,145 @@
+""" Assignment of exported items to groups.
+"""
+
+from typing import Tuple, Union, List, Dict, Sequence, Hashable
+
+Key = Tuple[int, int, str]
+
+# Units of items that are always assigned to the same group:
+#   'file': every item (i.e. exported file) separately
+#   'image': both sides of a radiograph, i.e. all items with the same SOF ID and visit
+#   'id': all visits and sides of an SOF ID
+STRATEGIES = ('file', 'image', 'id')
+
+
+def _unit(key: Key, strategy: str) -> Hashable:
+    """ Returns the unit the given item belongs to.
+    """
+    if strategy == 'file':
+        return key
+    elif strategy == 'image':
+        return key[0], key[1]
+    return key[0]
+
+
+def assign_groups(keys: Sequence[Key],
+                  num_groups: Union[None, int] = None,
+                  max_group_size: Union[None, int] = None,
+                  randomized: bool = False,
+                  seed: Union[None, int] = None,
+                  strategy: str = 'file') -> Tuple[Dict[Key, int], List[int]]:
+    """ Assigns items to groups.
+    Without randomization, the groups are filled one after another in the order of `keys`, up to `max_group_size` or
+    up to N / G items (rounded up) per group. If `num_groups` is given and the units do not pack into the groups this
+    way (since a unit is never split), the remaining units are assigned like with randomization, but in the order of
+    `keys`. With randomization, the units are shuffled and each unit is assigned to the smallest group, so that the
+    group sizes differ by at most the size of the largest unit. With `max_group_size`, a new group is added whenever a
+    unit does not fit into any group, so there may be more than N / `max_group_size` groups. Both run in
+    O(N log G) for N items and G groups.
+    :param keys: (sof_id, visit, side) keys of the items
+    :param num_groups: number of groups, only when max_group_size is not given
+    :param max_group_size: maximum number of items per group, only when num_groups is not given
+    :param randomized: if true, the assignment is random
+    :param seed: seed for the random assignment. If None, the assignment cannot be reproduced.
+    :param strategy: unit of items that are assigned to the same group, one of `STRATEGIES`
+    :return: (group_dict, group_sizes) tuple containing a dictionary mapping keys to groups and a list of group sizes
+    """
+    from collections import OrderedDict
+    from heapq import heapify, heappush, heappop
+    from math import ceil
+    from random import Random
+
+    if (not num_groups and not max_group_size) or (num_groups and max_group_size):
+        raise ValueError("Must set either num_groups or max_group_size")
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown grouping strategy: {strategy}. Supported strategies are: {', '.join(STRATEGIES)}")
+
+    units = OrderedDict()
+    for key in keys:
+        units.setdefault(_unit(key, strategy), []).append(key)
+    units = list(units.values())
+
+    num_items = len(keys)
+    num_groups = num_groups if num_groups else max(1, int(ceil(num_items / max_group_size)))
+    capacity = max_group_size if max_group_size else int(ceil(num_items / num_groups))
+
+    largest_unit = max((len(unit) for unit in units), default=0)
+    if max_group_size and largest_unit > max_group_size:
+        raise ValueError(f"Cannot keep {largest_unit} items in one group with a maximum group size of "
+                         f"{max_group_size}, use another grouping strategy")
+
+    group_sizes = [0 for _ in range(num_groups)]
+    group_dict = {}
+
+    def assign(unit, group):
+        for key in unit:
+            group_dict[key] = group
+        group_sizes[group] += len(unit)
+
+    if not randomized:
+        group = 0
+        remaining = iter(units)
+        for unit in remaining:
+            if group_sizes[group] and group_sizes[group] + len(unit) > capacity:
+                if group + 1 < num_groups:
+                    group += 1
+                elif max_group_size:
+                    group_sizes.append(0)
+                    group += 1
+                else:
+                    # The units do not pack into the given number of groups, distribute the rest as balanced as
+                    # possible
+                    units = [unit, *remaining]
+                    break
+            assign(unit, group)
+        else:
+            return group_dict, group_sizes
+    else:
+        units = list(units)
+        Random(seed).shuffle(units)
+
+    heap = [(size, group) for group, size in enumerate(group_sizes)]
+    heapify(heap)
+    for unit in units:
+        size, group = heappop(heap)
+        if max_group_size and size + len(unit) > max_group_size:
+            # All groups are too full for this unit
+            heappush(heap, (size, group))
+            group_sizes.append(0)
+            group = len(group_sizes) - 1
+        assign(unit, group)
+        heappush(heap, (group_sizes[group], group))
+
+    return group_dict, group_sizes
+
+
+def save_assignment(filename: str, group_dict: Dict[Key, int]):
+    """ Writes a group assignment to a .csv file with the columns id, visit, side and group.
+    :param filename: path to the .csv file
+    :param group_dict: dictionary mapping (sof_id, visit, side) keys to groups, as returned by `assign_groups()`
+    """
+    from csv import writer
+
+    with open(filename, 'w', newline='') as fh:
+        csv_writer = writer(fh)
+        csv_writer.writerow(['id', 'visit', 'side', 'group'])
+        for (sof_id, visit, side), group in group_dict.items():
+            csv_writer.writerow([int(sof_id), int(visit), side, int(group)])
+
+
+def load_assignment(filename: str) -> Tuple[Dict[Key, int], List[int]]:
+    """ Reads a group assignment written by `save_assignment()`.
+    :param filename: path to the .csv file
+    :return: (group_dict, group_sizes) tuple, see `assign_groups()`
+    """
+    from csv import DictReader
+
+    group_dict = {}
+    with open(filename, 'r', newline='') as fh:
+        for row in DictReader(fh):
+            group_dict[(int(row['id']), int(row['visit']), row['side'])] = int(row['group'])
+
+    group_sizes = [0 for _ in range(max(group_dict.values(), default=-1) + 1)]
+    for group in group_dict.values():
+        group_sizes[group] += 1
+    return group_dict, group_sizes
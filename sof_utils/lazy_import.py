@@ -0,0 +1,50 @@
+""" Deferred imports of heavy dependencies.
+TensorFlow and TFDS take seconds to import. Modules and command line tools that use them bind the module names with
+`lazy_import()` instead of an import statement, so the import only happens when a code path actually uses them and
+e.g. `--help` or `--version` stay fast.
+"""
+
+from types import ModuleType
+from typing import Any
+
+
+class LazyModule(ModuleType):
+    """ Placeholder for a module that is imported on the first access of one of its attributes.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._lazy_module = None
+
+    def _load(self) -> ModuleType:
+        if self._lazy_module is None:
+            from importlib import import_module
+            self._lazy_module = import_module(self.__name__)
+        return self._lazy_module
+
+    def __getattr__(self, attribute: str) -> Any:
+        # Only called for attributes that are not set on the placeholder itself
+        value = getattr(self._load(), attribute)
+        # Later accesses do not go through __getattr__ anymore
+        setattr(self, attribute, value)
+        return value
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self) -> str:
+        state = 'imported' if self._lazy_module is not None else 'not imported yet'
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def lazy_import(name: str) -> ModuleType:
+    """ Returns the given module if it has been imported already, otherwise a placeholder that imports it on first use.
+    Missing modules raise an ImportError on first use instead of immediately.
+    :param name: absolute name of the module, e.g. 'tensorflow'
+    :return: module or `LazyModule`
+    """
+    import sys
+
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
+
@@ -1,4 +1,17 @@
-from typing import List, Dict, Tuple
+import re
+from typing import List, Dict, Tuple, IO, Iterator, Iterable, Union
+
+# Annotated image names: <SOF_ID>V<Visit><L|R>-<Width>x<Height>.png
+_LABEL_IMAGE_PATTERN = re.compile(r'^.*[/-]?([a-zA-B]*[0-9]+)V([0-9])+(L|R)-([0-9]+)x([0-9]+)\.png$')
+_IMAGE_FILENAME_PATTERN = re.compile(r'^(.*/)?([^/]+\.png)$')
+_WHITESPACE_PATTERN = re.compile(r'\s*')
+
+_NUM_LABEL_KEYPOINTS = 12
+
+# Columns of the labels returned by `read_label_file()`
+LABEL_FIELDNAMES = ['filename', 'id', 'visit', 'left_right', 'upside_down', 'incomplete', 'implant', 'width',
+                    'height', 'bbox_min_x', 'bbox_max_x', 'bbox_min_y', 'bbox_max_y'] + \
+                   [f"keypoint_{axis}_{index}" for index in range(_NUM_LABEL_KEYPOINTS) for axis in ('x', 'y')]
 
 
 def id_and_visit_from_filename(filename: str) -> Tuple[int, int]:
@@ -12,92 +25,270 @@ def id_and_visit_from_filename(filename: str) -> Tuple[int, int]:
     return int(match.groups()[0]), int(match.groups()[1])
 
 
-def read_label_file(filename: str) -> List[Dict]:
-    """ Reads proximal femur detection labels from a label-studio json file and returns
-        it's content in a cleaned up way.
-    :param filename: Path to a label-studio json file
-    :return: List of dictionary containing the information:
-        (id: str, flipped: int, left_incomplete: int, left_incomplete_shaft:int, left_implant,
-         right_incomplete: int, right_incomplete_shaft:int, right_implant,
-         left_bbox_x: float, left_bbox_y: float, left_bbox_w: float, left_bbox_h: float,
-         right_bbox_x: float, right_bbox_y: float, right_bbox_w: float, right_bbox_h: float) where the id
-         is stored in the format <SOF_ID>V<Visit> and all int values are either 0 (false/absent) or 1 (true/present).
-         The bbox coordinates are given in absolute pixel coordinates.
+def png_size(encoded: bytes) -> Tuple[int, int]:
+    """ Reads the image size from the header of a PNG encoded image without decoding it.
+    :param encoded: PNG encoded image (at least the first 24 bytes)
+    :return: (width: int, height: int) of the image
+    """
+    from struct import unpack_from
+
+    if len(encoded) < 24 or encoded[:8] != b'\x89PNG\r\n\x1a\n' or encoded[12:16] != b'IHDR':
+        raise ValueError("Not a PNG encoded image")
+    return unpack_from('>II', encoded, 16)
+
+
+def iter_json_array(fh: IO, chunk_size: int = 1 << 16) -> Iterator:
+    """ Parses the items of a JSON array one after another, so only one item (and a chunk of the file) is kept in
+    memory instead of the whole array.
+    :param fh: text stream containing a JSON array
+    :param chunk_size: number of characters that are read at once
+    :return: generator of the items of the array
     """
     import json
-    import re
+
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    eof = False
+
+    def read_more(size=chunk_size):
+        nonlocal buffer, position, eof
+        chunk = fh.read(size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+        return not eof
+
+    def next_char():
+        nonlocal position
+        while True:
+            position = _WHITESPACE_PATTERN.match(buffer, position).end()
+            if position < len(buffer):
+                return buffer[position]
+            if not read_more():
+                return ""
+
+    if next_char() != "[":
+        raise ValueError("Expected a JSON array")
+    position += 1
+    if next_char() == "]":
+        return
+
+    while True:
+        next_char()
+        size = chunk_size
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+                # The item might continue in the next chunk (e.g. '4' of '4.5e3'), it is only complete if it is
+                # followed by a separator or by the end of the file
+                separator = _WHITESPACE_PATTERN.match(buffer, end).end()
+                if eof or (separator < len(buffer) and buffer[separator] in ',]'):
+                    break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            # Read larger chunks to parse large items in linear time
+            read_more(size)
+            size *= 2
+        position = end
+        yield item
+
+        separator = next_char()
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or ']' in JSON array, got {separator!r}")
+        position += 1
+
+
+def parse_label_item(item: Dict) -> Tuple[str, Union[None, Dict]]:
+    """ Converts a label-studio annotation into a label, see `read_label_file()`.
+    :param item: annotation of one image of a label-studio JSON_MIN export
+    :return: (filename: str, label: dict) tuple, the label is None if the annotation has invalid key points
+    """
+    match = _LABEL_IMAGE_PATTERN.match(item['image'])
+    if not match:
+        raise ValueError(f"Annotated image '{item['image']}' has wrong format!")
+    matches = match.groups()
+    image_filename = _IMAGE_FILENAME_PATTERN.match(item['image']).groups()[-1]
+
+    image_id = int(matches[0])
+    visit = int(matches[1])
+    lr = matches[2]
+    width = int(matches[3])
+    height = int(matches[4])
+
+    if "labels" in item:
+        image_labels = item['labels'] if isinstance(item['labels'], list) else [item['labels']]
+    else:
+        image_labels = []
+    incomplete = 1 if "Incomplete" in image_labels else 0
+    implant = 1 if "Implant" in image_labels else 0
+    upside_down = 1 if "UpsideDown" in image_labels else 0
+
+    invalid_keypoints = (incomplete + implant) > 0
+
+    if not invalid_keypoints and ("keypoints" not in item or len(item['keypoints']) != _NUM_LABEL_KEYPOINTS):
+        import sys
+        print(f"Annotation for {image_filename} has invalid keypoints. Skipping.", file=sys.stderr)
+        return image_filename, None
+
+    entry = {
+        'filename': image_filename,
+        'id': image_id,
+        'visit': visit,
+        'left_right': lr,
+        'upside_down': upside_down,
+        'incomplete': incomplete,
+        'implant': implant,
+        'width': width,
+        'height': height
+    }
+
+    if invalid_keypoints:
+        entry.update(bbox_min_x=0.0, bbox_max_x=100.0, bbox_min_y=0.0, bbox_max_y=100.0)
+        for index in range(_NUM_LABEL_KEYPOINTS):
+            entry[f"keypoint_x_{index}"] = 0.0
+            entry[f"keypoint_y_{index}"] = 0.0
+        return image_filename, entry
+
+    keypoints_x = [float(kp['x']) for kp in item['keypoints']]
+    keypoints_y = [float(kp['y']) for kp in item['keypoints']]
+    entry['bbox_min_x'] = min(keypoints_x)
+    entry['bbox_max_x'] = max(keypoints_x)
+    entry['bbox_min_y'] = min(keypoints_y)
+    entry['bbox_max_y'] = max(keypoints_y)
+
+    for index, (x, y) in enumerate(zip(keypoints_x, keypoints_y)):
+        entry[f"keypoint_x_{index}"] = x
+        entry[f"keypoint_y_{index}"] = y
+
+    return image_filename, entry
+
+
+def iter_label_file(filename: str) -> Iterator[Tuple[str, Union[None, Dict]]]:
+    """ Reads proximal femur detection labels from a label-studio json file (or a zipped export containing a
+    result.json) one annotation after another.
+    :param filename: Path to a label-studio json or zip file
+    :return: generator of (filename, label) tuples, see `parse_label_item()`
+    """
+    import io
     from pathlib import Path
     from zipfile import ZipFile
 
+    if Path(filename).suffix == '.zip':
+        with ZipFile(filename, 'r') as zip_file, zip_file.open('result.json', 'r') as fh:
+            for item in iter_json_array(io.TextIOWrapper(fh, encoding='utf-8')):
+                yield parse_label_item(item)
+    else:
+        with open(filename, 'r', encoding='utf-8') as fh:
+            for item in iter_json_array(fh):
+                yield parse_label_item(item)
+
+
+def read_label_file(filename: str) -> Tuple[List[Dict], List[str]]:
+    """ Reads proximal femur detection labels from a label-studio json file and returns
+        it's content in a cleaned up way.
+    :param filename: Path to a label-studio json file
+    :return: (labels, skipped) tuple of a list of dictionaries with the keys `LABEL_FIELDNAMES` and a list of the
+        filenames of the images with invalid key points. The id and the visit are stored as int, the flags
+        (upside_down, incomplete, implant) are either 0 (false/absent) or 1 (true/present). The bbox and key point
+        coordinates are given in absolute pixel coordinates.
+    """
     labels = []
+    skipped = []
+    for image_filename, entry in iter_label_file(filename):
+        if entry is None:
+            skipped.append(image_filename)
+        else:
+            labels.append(entry)
 
-    label_path = Path(filename)
+    return labels, skipped
 
-    open_file = lambda: open(filename, 'r')
 
-    skipped = []
+# Seconds the label reader waits for a batch before it checks whether the workers are still alive
+_LABEL_WORKER_POLL_INTERVAL = 1.0
 
-    if label_path.suffix == '.zip':
-        zip_file = ZipFile(label_path, 'r')
-        open_file = zip_file.open('result.json', 'r')
-
-    with open_file() as fh:
-        for item in json.load(fh):
-            matches = re.match('^.*[/-]?([a-zA-B]*[0-9]+)V([0-9])+(L|R)-([0-9]+)x([0-9]+)\.png$', item['image']).groups()
-            image_filename = re.match('^(.*/)?([^/]+\.png)$', item['image']).groups()[-1]
-            if not matches or len(matches) != 5:
-                raise ValueError(f"Annotated image '{item['image']}' has wrong format!")
-
-            image_id = int(matches[0])
-            visit = int(matches[1])
-            lr = matches[2]
-            width = int(matches[3])
-            height = int(matches[4])
-
-            if "labels" in item:
-                image_labels = item['labels'] if isinstance(item['labels'], List) else [item['labels']]
-            else:
-                image_labels = []
-            incomplete = 1 if "Incomplete" in image_labels else 0
-            implant = 1 if "Implant" in image_labels else 0
-            upside_down = 1 if "UpsideDown" in image_labels else 0
-
-            invalid_keypoints = (incomplete + implant) > 0
-
-            if not invalid_keypoints and ("keypoints" not in item or len(item['keypoints']) != 12):
-                import sys
-                print(f"Annotation for {image_filename} has invalid keypoints. Skipping.", file=sys.stderr)
-                skipped.append(image_filename)
-                continue
-
-            entry = {
-                'filename': image_filename,
-                'id': image_id,
-                'visit': visit,
-                'left_right': lr,
-                'upside_down': upside_down,
-                'incomplete': incomplete,
-                'implant': implant,
-                'width': width,
-                'height': height
-            }
-
-            keypoints = item['keypoints'] if not invalid_keypoints else [i for i in range(12)]
-
-            bbox_min_x = min([float(kp['x']) for kp in keypoints]) if not invalid_keypoints else 0.0
-            bbox_max_x = max([float(kp['x']) for kp in keypoints]) if not invalid_keypoints else 100.0
-            bbox_min_y = min([float(kp['y']) for kp in keypoints]) if not invalid_keypoints else 0.0
-            bbox_max_y = max([float(kp['y']) for kp in keypoints]) if not invalid_keypoints else 100.0
-
-            entry['bbox_min_x'] = bbox_min_x
-            entry['bbox_max_x'] = bbox_max_x
-            entry['bbox_min_y'] = bbox_min_y
-            entry['bbox_max_y'] = bbox_max_y
-
-            for index, kp in enumerate(keypoints):
-                entry[f"keypoint_x_{index}"] = float(kp['x']) if not invalid_keypoints else 0.0
-                entry[f"keypoint_y_{index}"] = float(kp['y']) if not invalid_keypoints else 0.0
 
-            labels.append(entry)
+def _read_labels_worker(index, tasks, results, batch_size):
+    """ Reads the files from the `tasks` queue until it gets None and puts (index, message) tuples into the `results`
+    queue. Messages are lists of labels, an exception if a file cannot be read, or None after the last file.
+    """
+    try:
+        for filename in iter(tasks.get, None):
+            batch = []
+            for label in iter_label_file(filename):
+                batch.append(label)
+                if len(batch) >= batch_size:
+                    results.put((index, batch))
+                    batch = []
+            if batch:
+                results.put((index, batch))
+    except Exception as e:
+        results.put((index, e))
+    else:
+        results.put((index, None))
 
-    return labels, skipped
+
+def iter_labels(filenames: Iterable[str], workers: int = 1,
+                batch_size: int = 256) -> Iterator[Tuple[str, Union[None, Dict]]]:
+    """ Reads the labels of multiple label-studio files, see `iter_label_file()`.
+    :param filenames: Paths to label-studio json or zip files
+    :param workers: number of processes that read files in parallel. If 0, the number of CPUs is used. With more than
+    one worker, the labels of different files are interleaved in no particular order.
+    :param batch_size: number of labels that are passed from a worker process at once
+    :return: generator of (filename, label) tuples, see `parse_label_item()`
+    """
+    import multiprocessing
+    import os
+    from queue import Empty
+
+    filenames = list(filenames)
+    workers = min(workers if workers > 0 else os.cpu_count() or 1, len(filenames))
+    if workers <= 1:
+        for filename in filenames:
+            yield from iter_label_file(filename)
+        return
+
+    tasks = multiprocessing.Queue()
+    for filename in filenames + [None] * workers:
+        tasks.put(filename)
+    # Bounded, so workers cannot run ahead of the consumer
+    results = multiprocessing.Queue(maxsize=4 * workers)
+    processes = [multiprocessing.Process(target=_read_labels_worker, args=(index, tasks, results, batch_size),
+                                         daemon=True)
+                 for index in range(workers)]
+    for process in processes:
+        process.start()
+
+    running = set(range(workers))
+    try:
+        while running:
+            try:
+                index, message = results.get(timeout=_LABEL_WORKER_POLL_INTERVAL)
+            except Empty:
+                # A worker that was killed (e.g. by the OOM killer) never sends its end marker
+                exited = [worker for worker in running if processes[worker].exitcode is not None]
+                if not exited:
+                    continue
+                try:
+                    # A worker that exits normally flushes its messages first, so its end marker may have arrived
+                    # after the timeout
+                    index, message = results.get_nowait()
+                except Empty:
+                    raise RuntimeError(f"Label reader process exited unexpectedly with exit code "
+                                       f"{processes[exited[0]].exitcode}")
+            if message is None:
+                running.remove(index)
+            elif isinstance(message, Exception):
+                raise message
+            else:
+                yield from message
+    finally:
+        # Do not block on file names that are left if the workers have been stopped early
+        tasks.cancel_join_thread()
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
@@ -0,0 +1,274 @@
+""" On-disk cache of decoded DICOM pixel data.
+"""
+
+import os
+import pathlib
+import threading
+from typing import Generator, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+# After exceeding the size limit, entries are evicted until the cache is at most this fraction of the limit, so the
+# cache directory is not scanned after every new entry
+_EVICTION_TARGET = 0.9
+
+_SUFFIX = '.npy'
+_TEMP_PREFIX = '.tmp-'
+
+
+def downsample_image(image: np.ndarray, factor: int) -> np.ndarray:
+    """ Downsamples an image by averaging blocks of `factor` x `factor` pixels.
+    Rows and columns that do not fill a whole block are dropped. Only single frame, single sample (e.g. monochrome)
+    images are supported: the pixel arrays of multi-frame (frames, rows, columns) and color (rows, columns, samples)
+    images cannot be told apart by their shape.
+    :param image: image of shape (rows, columns)
+    :param factor: downsampling factor, 1 returns the image unchanged
+    :return: downsampled image with the same dtype as `image`
+    """
+    if factor < 1:
+        raise ValueError(f"Invalid downsampling factor: {factor}")
+    if image.ndim != 2:
+        raise ValueError(f"Can only downsample images of shape (rows, columns), got an image of shape {image.shape}")
+    if factor == 1:
+        return image
+
+    rows, columns = image.shape[0] // factor, image.shape[1] // factor
+    blocks = np.asarray(image[:rows * factor, :columns * factor]).reshape((rows, factor, columns, factor))
+    mean = blocks.mean(axis=(1, 3))
+    if np.issubdtype(image.dtype, np.integer):
+        mean = np.rint(mean)
+    return mean.astype(image.dtype)
+
+
+def _decode_image(dcm_filename: str) -> np.ndarray:
+    from pydicom import dcmread
+
+    return dcmread(dcm_filename).pixel_array
+
+
+def _save(filename: pathlib.Path, image: np.ndarray) -> int:
+    """ Writes an array atomically, concurrent readers never see a partially written file.
+    :return: size of the written file in bytes
+    """
+    import tempfile
+
+    fd, temp_filename = tempfile.mkstemp(prefix=_TEMP_PREFIX, suffix=_SUFFIX, dir=str(filename.parent))
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            np.save(fh, np.ascontiguousarray(image), allow_pickle=False)
+        os.replace(temp_filename, str(filename))
+    except BaseException:
+        os.unlink(temp_filename)
+        raise
+    return filename.stat().st_size
+
+
+def _fill(directory: str, downsample: Optional[int], dcm_filename: str) -> Tuple[str, int, Optional[str]]:
+    """ Decodes a file into the cache, used by `PixelCache.prefill()` in worker processes.
+    :return: (dcm_filename, number of written bytes, error message or None) tuple
+    """
+    try:
+        return dcm_filename, PixelCache(directory)._fill(dcm_filename, downsample)[1], None
+    except Exception as e:
+        return dcm_filename, 0, f"{type(e).__name__}: {e}"
+
+
+class PixelCache:
+    """ Directory of decoded DICOM images stored as .npy files, which are returned as read-only memory maps.
+    Entries are keyed by the absolute path, the size and the modification time of a file, so modified files (including
+    files that were re-encoded with another transfer syntax) are decoded again. Looking up an entry does not open the
+    DICOM file. Memory maps of the same entry share their memory through the page cache, also across processes.
+    Optionally, downsampled variants of the images are stored next to the full images.
+    If a size limit is given, the least recently used entries are evicted when the limit is exceeded. The cache can
+    be used by multiple threads and processes at the same time, entries are written atomically.
+    """
+
+    def __init__(self, directory: Union[str, os.PathLike], max_bytes: Optional[int] = None):
+        """ Opens (or creates) the cache at the given location.
+        :param directory: cache directory
+        :param max_bytes: if given, maximum total size of the cached files
+        """
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Estimated total size of the cache, only tracked if there is a size limit
+        self._size = 0
+        self._added(self.size() if max_bytes is not None else 0)
+
+    def key(self, dcm_filename: Union[str, os.PathLike]) -> str:
+        """ Returns the key of the current version of the given file.
+        :param dcm_filename: path to a DICOM file
+        :return: hex digest of the absolute path, size and modification time of the file
+        """
+        import hashlib
+
+        path = os.path.abspath(dcm_filename)
+        stat = os.stat(path)
+        key = f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}"
+        return hashlib.sha1(key.encode('utf-8', 'surrogateescape')).hexdigest()
+
+    def _filename(self, key: str, downsample: Optional[int] = None) -> pathlib.Path:
+        variant = f"-{downsample}x" if downsample and downsample > 1 else ''
+        return self.directory.joinpath(f"{key}{variant}{_SUFFIX}")
+
+    def _load(self, filename: pathlib.Path) -> Optional[np.memmap]:
+        try:
+            image = np.load(str(filename), mmap_mode='r', allow_pickle=False)
+        except FileNotFoundError:
+            return None
+        try:
+            # The modification time of a cache file is the time of its last use
+            os.utime(str(filename))
+        except OSError:
+            pass
+        return image
+
+    def get(self, dcm_filename: Union[str, os.PathLike], downsample: Optional[int] = None) -> Optional[np.memmap]:
+        """ Returns the cached image of the given file without decoding it.
+        :param dcm_filename: path to a DICOM file
+        :param downsample: if given, return the variant downsampled by this factor, see `downsample_image()`
+        :return: read-only memory mapped image, or None if the image is not cached
+        """
+        return self._load(self._filename(self.key(dcm_filename), downsample))
+
+    def _fill(self, dcm_filename: Union[str, os.PathLike], downsample: Optional[int] = None) \
+            -> Tuple[np.ndarray, int]:
+        """ Returns the image of the given file and adds the missing entries to the cache.
+        :return: (image, number of written bytes) tuple
+        """
+        key = self.key(dcm_filename)
+        variant = downsample is not None and downsample > 1
+        if variant:
+            image = self._load(self._filename(key, downsample))
+            if image is not None:
+                return image, 0
+
+        written = 0
+        image = self._load(self._filename(key))
+        if image is None:
+            image, size = self._store(self._filename(key), _decode_image(str(dcm_filename)))
+            written += size
+        if variant:
+            image, size = self._store(self._filename(key, downsample), downsample_image(image, downsample))
+            written += size
+        return image, written
+
+    def _store(self, filename: pathlib.Path, image: np.ndarray) -> Tuple[np.ndarray, int]:
+        """ Writes an image to the cache.
+        :return: (memory mapped image, size of the written file) tuple. The image itself is returned if the file has
+            been evicted by another process in the meantime.
+        """
+        size = _save(filename, image)
+        stored = self._load(filename)
+        if stored is None:
+            image.setflags(write=False)
+            return image, size
+        return stored, size
+
+    def _added(self, written: int):
+        """ Accounts for newly written files and evicts entries if the size limit is exceeded.
+        """
+        if self.max_bytes is None or not written:
+            return
+        with self._lock:
+            self._size += written
+            exceeded = self._size > self.max_bytes
+        if exceeded:
+            self.evict(int(self.max_bytes * _EVICTION_TARGET))
+
+    def read_image(self, dcm_filename: Union[str, os.PathLike], downsample: Optional[int] = None) -> np.memmap:
+        """ Returns the image of the given file, decoding and caching it if it is not cached yet.
+        :param dcm_filename: path to a DICOM file
+        :param downsample: if given, return the variant downsampled by this factor, see `downsample_image()`. The
+            full image is cached as well.
+        :return: read-only memory mapped image
+        """
+        image, written = self._fill(dcm_filename, downsample)
+        self._added(written)
+        return image
+
+    def prefill(self, files: Iterable[Union[str, os.PathLike]], downsample: Optional[int] = None, workers: int = 0,
+                chunksize: int = 1, threads: bool = False) -> Generator[Tuple[str, Optional[str]], None, None]:
+        """ Decodes all files that are not cached yet.
+        :param files: DICOM files
+        :param downsample: if given, also cache the variants downsampled by this factor
+        :param workers: number of worker processes (or threads), 0 (default) decodes the files serially
+        :param chunksize: number of files sent to a worker at once
+        :param threads: if True, use threads instead of processes
+        :return: Generator of (file, error) pairs in the order of completion, `error` is None if the image is cached
+        """
+        from functools import partial
+        from .dicom import _parallel_map
+
+        for dcm_filename, written, error in _parallel_map(partial(_fill, str(self.directory), downsample),
+                                                          (str(file) for file in files), workers=workers,
+                                                          chunksize=chunksize, threads=threads):
+            self._added(written)
+            yield dcm_filename, error
+
+    def _entries(self) -> List[Tuple[int, int, pathlib.Path]]:
+        """ Returns (last use in ns, size, filename) tuples of all cached files.
+        """
+        entries = []
+        for entry in os.scandir(str(self.directory)):
+            if entry.name.endswith(_SUFFIX) and not entry.name.startswith(_TEMP_PREFIX):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, pathlib.Path(entry.path)))
+        return entries
+
+    def size(self) -> int:
+        """ Returns the total size of the cached files in bytes.
+        """
+        return sum(size for _, size, _ in self._entries())
+
+    def __len__(self) -> int:
+        return len(self._entries())
+
+    def evict(self, max_bytes: Optional[int] = None) -> int:
+        """ Removes the least recently used files until the cache is not larger than the given size.
+        Removed files stay valid for memory maps that are still open.
+        :param max_bytes: target size of the cache, defaults to the size limit of the cache
+        :return: number of removed files
+        """
+        if max_bytes is None:
+            if self.max_bytes is None:
+                return 0
+            max_bytes = self.max_bytes
+
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda entry: entry[0])
+            size = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, file_size, filename in entries:
+                if size <= max_bytes:
+                    break
+                try:
+                    filename.unlink()
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    continue
+                size -= file_size
+                removed += 1
+            self._size = size
+        return removed
+
+    def clear(self) -> int:
+        """ Removes all files from the cache, including left-over temporary files of interrupted writes.
+        :return: number of removed files
+        """
+        with self._lock:
+            removed = 0
+            for entry in os.scandir(str(self.directory)):
+                if entry.name.endswith(_SUFFIX):
+                    try:
+                        os.unlink(entry.path)
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+            self._size = 0
+        return removed
@@ -16,7 +16,25 @@
 r"""Utilities for creating TFRecords of TF examples for the Open Images dataset.
 """
 
-import tensorflow as tf
+from .lazy_import import lazy_import
+
+tf = lazy_import('tensorflow')
+
+
+def sharded_output_filenames(base_path, num_shards):
+    """Returns the file names of all TFRecord shards.
+    Args:
+      base_path: The base path for all shards
+      num_shards: The number of shards
+    Returns:
+      The list of file names. Position k in the list corresponds to shard k.
+    """
+    if num_shards > 1:
+        return [
+            '{}-{:05d}-of-{:05d}'.format(base_path, idx, num_shards)
+            for idx in range(num_shards)
+        ]
+    return [base_path]
 
 
 def open_sharded_output_tfrecords(exit_stack, base_path, num_shards):
@@ -30,13 +48,7 @@ def open_sharded_output_tfrecords(exit_stack, base_path, num_shards):
       The list of opened TFRecords. Position k in the list corresponds to shard k.
     """
 
-    if num_shards > 1:
-        tf_record_output_filenames = [
-            '{}-{:05d}-of-{:05d}'.format(base_path, idx, num_shards)
-            for idx in range(num_shards)
-        ]
-    else:
-        tf_record_output_filenames = [base_path]
+    tf_record_output_filenames = sharded_output_filenames(base_path, num_shards)
 
     tfrecords = [
         exit_stack.enter_context(tf.io.TFRecordWriter(file_name))
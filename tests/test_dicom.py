@@ -0,0 +1,86 @@
+import pytest
+
+from sof_utils import dicom
+
+
+def _name_length(file):
+    return len(file.name)
+
+
+def test_indexed_map_only_computes_misses(tmp_path):
+    files = []
+    for index in range(20):
+        file = tmp_path.joinpath(f"{'x' * (index + 1)}.dcm")
+        file.write_bytes(b'')
+        files.append(file)
+    cache = {file: len(file.name) for file in files[::3]}
+    computed = []
+
+    def get(file, size, mtime_ns):
+        return cache.get(file)
+
+    def put(file, size, mtime_ns, result):
+        computed.append(file)
+
+    expected = [len(file.name) for file in files]
+    for kwargs in (dict(workers=0), dict(workers=2, threads=True, ordered=True, chunksize=1),
+                   dict(workers=2, ordered=True, chunksize=2)):
+        computed.clear()
+        results = list(dicom._indexed_map(_name_length, files, get, put, **kwargs))
+        assert results == expected, kwargs
+        assert computed == [file for file in files if file not in cache]
+
+    computed.clear()
+    results = list(dicom._indexed_map(_name_length, files, get, put, workers=2, threads=True))
+    assert sorted(results) == sorted(expected)
+    assert sorted(computed) == sorted(file for file in files if file not in cache)
+
+
+def _check(item):
+    import faulthandler
+    import os
+    import signal
+    import time
+
+    if item == 'hang':
+        time.sleep(60)
+    elif item == 'crash':
+        # Like a decoder crashing inside of a C extension, without the traceback of pytest's fault handler
+        faulthandler.disable()
+        os.kill(os.getpid(), signal.SIGSEGV)
+    elif item == 'killed':
+        os.kill(os.getpid(), signal.SIGKILL)
+    elif item == 'error':
+        raise KeyError(item)
+    return item.upper()
+
+
+def _failed(item, exitcode):
+    return f"{item}:{exitcode}"
+
+
+def test_supervised_map_survives_timeouts_and_dead_workers():
+    import signal
+
+    items = ['a', 'hang', 'b', 'crash', 'c', 'killed', 'd', 'e', 'f']
+    expected = ['A', 'hang:None', 'B', f"crash:{-signal.SIGSEGV}", 'C', f"killed:{-signal.SIGKILL}", 'D', 'E', 'F']
+    for kwargs in (dict(workers=1, chunksize=1), dict(workers=2, chunksize=3), dict(workers=3, chunksize=2)):
+        results = list(dicom._supervised_map(_check, items, _failed, ordered=True, timeout=0.5, **kwargs))
+        assert results == expected, kwargs
+        results = list(dicom._supervised_map(_check, items, _failed, timeout=0.5, **kwargs))
+        assert sorted(results) == sorted(expected), kwargs
+
+
+def test_supervised_map_raises_errors():
+    with pytest.raises(KeyError):
+        list(dicom._supervised_map(_check, ['a', 'error', 'b'], _failed, workers=2))
+
+
+def test_check_files_reports_dead_workers(tmp_path, monkeypatch):
+    file = tmp_path.joinpath('image.dcm')
+    file.write_bytes(b'')
+    # The monitored workers are forked, so they see the patched check
+    monkeypatch.setattr(dicom, 'check_corruption', lambda dcm_filename, level: _check('killed'))
+    assert list(dicom.check_files([file], workers=1)) == [(dicom.OUT_OF_MEMORY, 'image.dcm')]
+    monkeypatch.setattr(dicom, 'check_corruption', lambda dcm_filename, level: _check('hang'))
+    assert list(dicom.check_files([file], timeout=0.2)) == [(dicom.TIMEOUT, 'image.dcm')]
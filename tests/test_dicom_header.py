@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+from pydicom.multival import MultiValue
+
+from sof_utils import dicom
+
+_KEYWORDS = ('TransferSyntaxUID', 'Modality', 'PatientID', 'PixelSpacing', 'SamplesPerPixel', 'Rows', 'Columns',
+             'PixelRepresentation', 'SmallestImagePixelValue', 'LargestImagePixelValue', 'WindowCenter')
+
+
+def _write_dicom(filename, transfer_syntax, signed=False, sequence=False, padding=0):
+    """ Writes a small DICOM file with the given transfer syntax.
+    :param signed: if true, the pixel data and the smallest/largest pixel values are signed
+    :param sequence: if true, an undefined length sequence precedes the image elements
+    :param padding: length of a long text element before the image elements, to make the header larger
+    """
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.sequence import Sequence
+    from pydicom.uid import SecondaryCaptureImageStorage, generate_uid
+
+    pixels = (np.arange(-6, 6, dtype=np.int16) if signed else np.arange(12, dtype=np.uint16)).reshape((3, 4))
+
+    file_meta = FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = SecondaryCaptureImageStorage
+    file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    file_meta.TransferSyntaxUID = transfer_syntax
+
+    dcm = Dataset()
+    dcm.file_meta = file_meta
+    dcm.SOPClassUID = file_meta.MediaStorageSOPClassUID
+    dcm.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+    dcm.Modality = 'CR'
+    if padding:
+        dcm.StudyComments = 'x' * padding
+    if sequence:
+        item = Dataset()
+        item.CodeValue = '12345'
+        item.CodeMeaning = 'Hip'
+        dcm.AnatomicRegionSequence = Sequence([item])
+        dcm['AnatomicRegionSequence'].is_undefined_length = True
+    dcm.PatientID = '10001'
+    dcm.SamplesPerPixel = 1
+    dcm.PhotometricInterpretation = 'MONOCHROME2'
+    dcm.Rows, dcm.Columns = pixels.shape
+    dcm.PixelSpacing = [0.15, 0.2]
+    dcm.BitsAllocated = 16
+    dcm.BitsStored = 16
+    dcm.HighBit = 15
+    dcm.PixelRepresentation = int(signed)
+    dcm.SmallestImagePixelValue = int(pixels.min())
+    dcm.LargestImagePixelValue = int(pixels.max())
+    dcm.WindowCenter = [100, 200]
+    dcm.PixelData = pixels.tobytes()
+    dcm.save_as(str(filename), enforce_file_format=True)
+    return filename
+
+
+@pytest.mark.parametrize('transfer_syntax', ['1.2.840.10008.1.2', '1.2.840.10008.1.2.1'])
+@pytest.mark.parametrize('signed', [False, True])
+@pytest.mark.parametrize('sequence', [False, True])
+def test_read_header_matches_pydicom(tmp_path, transfer_syntax, signed, sequence):
+    filename = str(_write_dicom(tmp_path.joinpath('image.dcm'), transfer_syntax, signed, sequence))
+    buf = open(filename, 'rb').read()
+    # The fast parser handles the file, without falling back to pydicom
+    parsed = dicom._parse_header_prefix(buf, dicom._keyword_tags(_KEYWORDS), eof=True)
+    expected = dicom.read_header(filename, _KEYWORDS, max_bytes=0)
+
+    assert parsed == dicom.read_header(filename, _KEYWORDS)
+    assert parsed == {keyword: list(value) if isinstance(value, MultiValue) else value
+                      for keyword, value in expected.items()}
+    # Sequence delimitation item
+    assert (b'\xfe\xff\xdd\xe0' in buf) == sequence
+    assert parsed['SmallestImagePixelValue'] == (-6 if signed else 0)
+    assert parsed['PixelSpacing'] == [0.15, 0.2]
+    assert dicom.read_meta(filename) == (4, 3, -6 if signed else 0, 5 if signed else 11)
+
+
+def test_read_header_missing_elements(tmp_path):
+    filename = str(_write_dicom(tmp_path.joinpath('image.dcm'), '1.2.840.10008.1.2.1'))
+    for max_bytes in (0, dicom.HEADER_PREFIX_SIZE):
+        assert dicom.read_header(filename, ('Rows', 'PatientName'), max_bytes) == {'Rows': 3, 'PatientName': None}
+
+
+def test_read_header_falls_back_to_pydicom(tmp_path):
+    # The header does not fit into the prefix
+    filename = str(_write_dicom(tmp_path.joinpath('image.dcm'), '1.2.840.10008.1.2.1', padding=1024))
+    buf = open(filename, 'rb').read(512)
+    with pytest.raises(dicom._FastPathFailed):
+        dicom._parse_header_prefix(buf, dicom._keyword_tags(('Rows',)), eof=False)
+    assert dicom.read_header(filename, ('Rows', 'Columns'), max_bytes=512) == {'Rows': 3, 'Columns': 4}
+    assert dicom.read_meta(filename, max_bytes=512) == (4, 3, 0, 11)
+
+
+def test_read_header_unknown_keyword(tmp_path):
+    filename = str(_write_dicom(tmp_path.joinpath('image.dcm'), '1.2.840.10008.1.2.1'))
+    with pytest.raises(ValueError):
+        dicom.read_header(filename, ('NotAKeyword',))
+
+
+def test_read_meta_requires_all_elements(tmp_path):
+    from pydicom import dcmread
+
+    filename = str(_write_dicom(tmp_path.joinpath('image.dcm'), '1.2.840.10008.1.2.1'))
+    dcm = dcmread(filename)
+    del dcm.LargestImagePixelValue
+    dcm.save_as(filename)
+    with pytest.raises(AttributeError):
+        dicom.read_meta(filename)
@@ -0,0 +1,89 @@
+import pathlib
+import warnings
+import zipfile
+
+import pytest
+
+from sof_utils import export
+
+_PARAMETERS = {'format': 'png', 'split_lr': True, 'max_group_size': 2}
+
+
+def _write_zip(path, members):
+    with warnings.catch_warnings():
+        # Duplicate members are written on purpose
+        warnings.simplefilter('ignore', UserWarning)
+        with zipfile.ZipFile(str(path), 'a') as zf:
+            for name, data in members:
+                zf.writestr(name, data)
+
+
+def _export(directory: pathlib.Path):
+    """ Writes one plain file and one zip member and records them in a new manifest.
+    """
+    manifest = export._Manifest(directory.joinpath(export._MANIFEST_NAME))
+    manifest.open(_PARAMETERS, append=False)
+    directory.joinpath('10000V1L.png').write_bytes(b'left')
+    manifest.add((10000, 1, 'L'), directory.joinpath('10000V1L.png'), None, b'left', None)
+    _write_zip(directory.joinpath('group_0.zip'), [('10000V1R.png', b'right')])
+    manifest.add((10000, 1, 'R'), directory.joinpath('group_0.zip'), '10000V1R.png', b'right', 0)
+    manifest.close()
+    return manifest
+
+
+def test_manifest_resume(tmp_path):
+    manifest = _export(tmp_path)
+    entries = manifest.resume(_PARAMETERS)
+    assert sorted(entries) == [(10000, 1, 'L'), (10000, 1, 'R')]
+    assert entries[(10000, 1, 'L')]['file'] == '10000V1L.png'
+    assert entries[(10000, 1, 'R')]['member'] == '10000V1R.png'
+    assert entries[(10000, 1, 'R')]['group'] == 0
+
+    assert export._Manifest(tmp_path.joinpath('missing.jsonl')).resume(_PARAMETERS) == {}
+
+
+def test_manifest_rejects_changed_parameters(tmp_path):
+    manifest = _export(tmp_path)
+    with pytest.raises(ValueError):
+        manifest.resume({**_PARAMETERS, 'max_group_size': 3})
+
+
+def test_manifest_skips_modified_and_missing_items(tmp_path):
+    manifest = _export(tmp_path)
+    tmp_path.joinpath('10000V1L.png').write_bytes(b'LEFT')
+    assert sorted(manifest.resume(_PARAMETERS)) == [(10000, 1, 'R')]
+
+    tmp_path.joinpath('10000V1L.png').unlink()
+    tmp_path.joinpath('group_0.zip').unlink()
+    _write_zip(tmp_path.joinpath('group_0.zip'), [('other.png', b'right')])
+    assert manifest.resume(_PARAMETERS) == {}
+
+
+def test_manifest_resume_after_interruption(tmp_path):
+    manifest = _export(tmp_path)
+    with open(str(manifest.path), 'a') as fh:
+        fh.write('{"key": [10001, 1, "L"], "fi')
+    assert sorted(manifest.resume(_PARAMETERS)) == [(10000, 1, 'L'), (10000, 1, 'R')]
+
+    # The item is written again into the zip file, the last entry of the manifest is valid
+    manifest.open(_PARAMETERS, append=True)
+    _write_zip(tmp_path.joinpath('group_0.zip'), [('10000V1R.png', b'RIGHT')])
+    manifest.add((10000, 1, 'R'), tmp_path.joinpath('group_0.zip'), '10000V1R.png', b'RIGHT', 0)
+    manifest.close()
+
+    entries = manifest.resume(_PARAMETERS)
+    assert sorted(entries) == [(10000, 1, 'L'), (10000, 1, 'R')]
+    assert entries[(10000, 1, 'R')]['size'] == len(b'RIGHT')
+
+
+def test_prune_zip_keeps_last_duplicate(tmp_path):
+    path = tmp_path.joinpath('group_0.zip')
+    _write_zip(path, [('a.png', b'old'), ('b.png', b'b'), ('a.png', b'new'), ('c.png', b'c')])
+    export._prune_zip(path, {'a.png', 'c.png'})
+    with zipfile.ZipFile(str(path)) as zf:
+        assert zf.namelist() == ['a.png', 'c.png']
+        assert zf.read('a.png') == b'new'
+
+    modified = path.stat().st_mtime_ns
+    export._prune_zip(path, {'a.png', 'c.png'})
+    assert path.stat().st_mtime_ns == modified
@@ -0,0 +1,84 @@
+import pytest
+
+from sof_utils import grouping
+
+
+def _keys(num_ids, visits=(1, 2), sides=('L', 'R')):
+    return [(10000 + index, visit, side) for index in range(num_ids) for visit in visits for side in sides]
+
+
+def _check(keys, group_dict, group_sizes):
+    assert sorted(group_dict) == sorted(keys)
+    assert sum(group_sizes) == len(keys)
+    for group, size in enumerate(group_sizes):
+        assert size == sum(1 for assigned in group_dict.values() if assigned == group)
+
+
+@pytest.mark.parametrize('strategy', grouping.STRATEGIES)
+def test_randomized_groups_are_balanced(strategy):
+    keys = _keys(101)
+    unit_size = {'file': 1, 'image': 2, 'id': 4}[strategy]
+    group_dict, group_sizes = grouping.assign_groups(keys, num_groups=7, randomized=True, seed=3, strategy=strategy)
+    _check(keys, group_dict, group_sizes)
+    assert len(group_sizes) == 7
+    assert max(group_sizes) - min(group_sizes) <= unit_size
+    # All items of a unit are in the same group
+    for key in keys:
+        assert group_dict[key] == group_dict[{'file': key, 'image': key[:2] + ('L',), 'id': (key[0], 1, 'L')}[strategy]]
+
+
+def test_randomized_groups_are_reproducible():
+    keys = _keys(50)
+    first = grouping.assign_groups(keys, max_group_size=16, randomized=True, seed=42, strategy='image')
+    assert grouping.assign_groups(keys, max_group_size=16, randomized=True, seed=42, strategy='image') == first
+    assert grouping.assign_groups(keys, max_group_size=16, randomized=True, seed=43, strategy='image') != first
+    assert grouping.assign_groups(list(reversed(keys)), max_group_size=16, randomized=True, seed=42,
+                                  strategy='image')[0] != first[0]
+
+
+def test_sequential_groups():
+    keys = _keys(5, visits=(1,))
+    group_dict, group_sizes = grouping.assign_groups(keys, max_group_size=4)
+    _check(keys, group_dict, group_sizes)
+    assert group_sizes == [4, 4, 2]
+    assert [group_dict[key] for key in keys] == [0, 0, 0, 0, 1, 1, 1, 1, 2, 2]
+
+
+@pytest.mark.parametrize('randomized', [False, True])
+def test_max_group_size_overflow(randomized):
+    # Units of 3 items do not pack into groups of 4, every group takes only one unit
+    keys = _keys(5, visits=(1,), sides=('L', 'M', 'R'))
+    group_dict, group_sizes = grouping.assign_groups(keys, max_group_size=4, randomized=randomized, seed=0,
+                                                     strategy='id')
+    _check(keys, group_dict, group_sizes)
+    assert group_sizes == [3, 3, 3, 3, 3]
+
+    with pytest.raises(ValueError):
+        grouping.assign_groups(keys, max_group_size=2, randomized=randomized, strategy='id')
+
+
+def test_num_groups_fallback_when_units_do_not_pack():
+    # 3 units of 3 items into 2 groups of up to 5 items: the third unit does not fit and goes to the smallest group
+    keys = _keys(3, visits=(1,), sides=('L', 'M', 'R'))
+    group_dict, group_sizes = grouping.assign_groups(keys, num_groups=2, strategy='id')
+    _check(keys, group_dict, group_sizes)
+    assert group_sizes == [6, 3]
+    assert [group_dict[key] for key in keys] == [0, 0, 0, 1, 1, 1, 0, 0, 0]
+
+
+def test_invalid_arguments():
+    keys = _keys(2)
+    with pytest.raises(ValueError):
+        grouping.assign_groups(keys)
+    with pytest.raises(ValueError):
+        grouping.assign_groups(keys, num_groups=2, max_group_size=2)
+    with pytest.raises(ValueError):
+        grouping.assign_groups(keys, num_groups=2, strategy='visit')
+
+
+def test_save_and_load_assignment(tmp_path):
+    keys = _keys(10)
+    group_dict, group_sizes = grouping.assign_groups(keys, num_groups=3, randomized=True, seed=1, strategy='id')
+    filename = str(tmp_path.joinpath('groups.csv'))
+    grouping.save_assignment(filename, group_dict)
+    assert grouping.load_assignment(filename) == (group_dict, group_sizes)
@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from sof_utils import misc
+
+
+def _item(sof_id, visit, side):
+    return {
+        'image': f"/data/upload/{sof_id}-SF{sof_id}V{visit}{side}-800x1600.png",
+        'keypoints': [{'x': index + 0.5, 'y': 2.0 * index} for index in range(12)],
+    }
+
+
+def _write_label_files(directory, num_files, items_per_file):
+    filenames = []
+    for file_index in range(num_files):
+        filename = directory.joinpath(f"labels-{file_index}.json")
+        items = [_item(1000 * file_index + index, 1 + index % 2, 'LR'[index % 2]) for index in range(items_per_file)]
+        filename.write_text(json.dumps(items))
+        filenames.append(str(filename))
+    return filenames
+
+
+def _sorted(labels):
+    return sorted(labels, key=lambda label: label[0])
+
+
+def test_iter_labels_parallel_matches_serial(tmp_path, monkeypatch):
+    # Poll very often, so workers regularly exit between a timeout and the check of their exit codes
+    monkeypatch.setattr(misc, '_LABEL_WORKER_POLL_INTERVAL', 0.001)
+    filenames = _write_label_files(tmp_path, 8, 50)
+    serial = list(misc.iter_labels(filenames))
+    assert len(serial) == 400
+    for workers in (2, 3, 8):
+        for _ in range(5):
+            assert _sorted(misc.iter_labels(filenames, workers=workers, batch_size=7)) == _sorted(serial)
+
+
+def test_iter_labels_parallel_raises_errors(tmp_path):
+    filenames = _write_label_files(tmp_path, 2, 5)
+    invalid = tmp_path.joinpath('invalid.json')
+    invalid.write_text('{"not": "an array"}')
+    with pytest.raises(ValueError):
+        list(misc.iter_labels(filenames + [str(invalid)], workers=3))
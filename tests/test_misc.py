@@ -0,0 +1,28 @@
+import io
+import json
+
+import pytest
+
+from sof_utils.misc import iter_json_array
+
+_ITEMS = [12.5, 4.5e3, -7, 0, 1e-3, "a string, with [brackets]", "", True, False, None,
+          {"image": "SF10000V1L-512x1024.png", "keypoints": [{"x": 1.25, "y": -3e2}], "labels": {"nested": [1, 2]}},
+          [], {}, [[1.5, [2.25]], {"x": "}"}], 123456789]
+
+
+def test_iter_json_array_all_chunk_sizes():
+    for text in (json.dumps(_ITEMS), json.dumps(_ITEMS, indent=2), ' [ 12.5 , 4.5e3 ] \n'):
+        expected = json.loads(text)
+        for chunk_size in range(1, len(text) + 1):
+            assert list(iter_json_array(io.StringIO(text), chunk_size)) == expected, chunk_size
+
+
+def test_iter_json_array_empty():
+    for chunk_size in (1, 2, 64):
+        assert list(iter_json_array(io.StringIO(' [ ] '), chunk_size)) == []
+
+
+@pytest.mark.parametrize('text', ['{"a": 1}', '[1 2]', '[1,', '[12.5'])
+def test_iter_json_array_invalid(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(text), 2))
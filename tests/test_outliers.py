@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from benchmarks.stages import load_script
+from benchmarks.synthetic import write_keypoint_csv
+
+outliers = load_script('sof-keypoint-outliers')
+
+
+@pytest.fixture(scope='module')
+def table_file(tmp_path_factory):
+    # More complete hips than fit into one descriptor chunk
+    return write_keypoint_csv(tmp_path_factory.mktemp('outliers').joinpath('table.csv'), 2500, seed=3)
+
+
+def test_find_outliers_matches_streaming(table_file):
+    found = outliers.find_outliers(outliers.load_columns(table_file), 0.9, ignore=[3])
+    streamed = outliers.find_outliers_streaming(str(table_file), 0.9, ignore=[3], chunk_size=1000)
+    assert found
+    assert [(row["id"], row["lr"]) for row in found] == [(row["id"], row["lr"]) for row in streamed]
+    assert all(row["class"].lower() == "complete" for row in found)
+
+
+def test_find_outliers_row_table(table_file):
+    found = outliers.find_outliers(outliers.load_columns(table_file))
+    assert outliers.find_outliers(outliers.load_table(str(table_file))) == found
+
+
+def test_fit_statistics_matches_single_pass():
+    descriptors = np.random.default_rng(0).normal(size=(1000, 5))
+    chunks = [(None, None, descriptors[start:start + 128]) for start in range(0, len(descriptors), 128)]
+    mean, cov, count = outliers.fit_statistics(chunks)
+    assert count == len(descriptors)
+    np.testing.assert_allclose(mean, descriptors.mean(axis=0))
+    np.testing.assert_allclose(cov, np.cov(descriptors, rowvar=False))
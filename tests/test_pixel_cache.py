@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from sof_utils import dicom
+from sof_utils.pixel_cache import PixelCache, downsample_image
+
+
+def test_downsample_image():
+    image = np.arange(5 * 7, dtype=np.uint16).reshape((5, 7))
+    downsampled = downsample_image(image, 2)
+    assert downsampled.dtype == np.uint16
+    assert downsampled.shape == (2, 3)
+    # Mean of the top left block [[0, 1], [7, 8]] is 4, the incomplete last row and column are dropped
+    assert downsampled[0, 0] == 4
+    np.testing.assert_array_equal(downsampled, np.rint(image[:4, :6].reshape((2, 2, 3, 2)).mean(axis=(1, 3))))
+    assert downsample_image(image, 1) is image
+
+
+def test_downsample_image_rejects_multiple_frames_and_samples():
+    with pytest.raises(ValueError):
+        downsample_image(np.zeros((3, 8, 8), dtype=np.uint16), 2)
+    with pytest.raises(ValueError):
+        downsample_image(np.zeros((8, 8, 3), dtype=np.uint8), 2)
+    with pytest.raises(ValueError):
+        downsample_image(np.zeros((8, 8), dtype=np.uint8), 0)
+
+
+def test_pixel_cache(tmp_path):
+    from benchmarks.synthetic import write_dicom_files
+
+    files = write_dicom_files(tmp_path.joinpath('dicom'), 4, (16, 12))
+    cache = PixelCache(tmp_path.joinpath('cache'))
+    assert cache.get(files[0]) is None
+
+    image = dicom.read_image(str(files[0]), cache=cache)
+    assert isinstance(image, np.memmap) and not image.flags.writeable
+    np.testing.assert_array_equal(image, dicom.read_image(str(files[0])))
+    np.testing.assert_array_equal(dicom.read_image(str(files[0]), cache=cache, downsample=2),
+                                  dicom.read_image(str(files[0]), downsample=2))
+    assert len(cache) == 2
+
+    assert [error for _, error in cache.prefill(files, workers=2)] == [None] * 4
+    assert len(cache) == 5
+    assert cache.clear() == 5 and len(cache) == 0